@@ -0,0 +1,160 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import random
+import signal
+import time
+
+from maze import Maze
+from mazecache import MazeCache, load_cache
+from robot import Robot
+from tester import run_robot, score
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+micromouse_dir = os.path.join(project_dir, '..', 'MicromouseSim-gh-pages', 'mazes_json')
+
+_caches = {}
+
+columns = ['maze', 'dim', 'score', 'run1', 'run2', 'coverage', 'cpu', 'wall', 'status']
+
+class Timeout(Exception):
+    pass
+
+def on_alarm(signum, frame):
+    raise Timeout()
+
+def default_mazes():
+    '''
+    The project's test mazes, followed by the MicromouseSim mazes.
+    '''
+
+    return (sorted(glob.glob(os.path.join(project_dir, 'test_maze_*.txt'))) +
+            sorted(glob.glob(os.path.join(micromouse_dir, '*.json'))))
+
+def open_cache(cache_file):
+    '''
+    The MazeCache of a cache file, opened once per process.
+    '''
+
+    if cache_file not in _caches:
+        _caches[cache_file] = MazeCache(cache_file)
+    return _caches[cache_file]
+
+def test_maze(filename, timeout = 60, seed = 0, cache_file = None, repair = None, timeline_dir = None):
+    '''
+    Runs a new robot, without visualization, through both runs on a maze and
+    returns a dict with the columns of the results table. The robot is
+    stopped after timeout seconds; cpu is the CPU time of the whole test
+    (loading the maze included), wall the elapsed time. With a cache file
+    (see mazecache.py), the maze is read from the cache instead of its file.
+    repair is passed on to Maze, to accept mazes with inconsistent walls.
+    With a timeline_dir, the robot's coverage timeline of run 1 is saved
+    there as <maze>.csv.
+    '''
+
+    result = dict((column, None) for column in columns)
+    result['maze'] = os.path.splitext(os.path.basename(filename))[0]
+    result['status'] = 'ok'
+    random.seed(seed)
+    start_cpu = time.clock()
+    start_wall = time.time()
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.alarm(timeout)
+    try:
+        if cache_file is None:
+            testmaze = Maze(filename, repair = repair)
+        else:
+            testmaze = open_cache(cache_file).maze(os.path.basename(filename), repair)
+        result['dim'] = testmaze.dim
+        testrobot = Robot(testmaze.dim, visualize = False)
+        runtimes = run_robot(testmaze, testrobot, verbose = False)
+        result['score'] = score(runtimes)
+        if len(runtimes) > 0:
+            result['run1'] = runtimes[0]
+        if len(runtimes) > 1:
+            result['run2'] = runtimes[1]
+        else:
+            result['status'] = 'incomplete'
+        result['coverage'] = float(testrobot.calculate_coverage_percentage())
+        if timeline_dir is not None:
+            testrobot.save_coverage_timeline(os.path.join(timeline_dir, result['maze'] + '.csv'))
+    except Timeout:
+        result['status'] = 'timeout'
+    except Exception as e:
+        result['status'] = '{}: {}'.format(e.__class__.__name__, e)
+    finally:
+        signal.alarm(0)
+    result['cpu'] = time.clock() - start_cpu
+    result['wall'] = time.time() - start_wall
+    return result
+
+def _test_maze_star(args):
+    return test_maze(*args)
+
+def run_batch(mazes, processes = None, timeout = 60, seed = 0, cache_file = None, repair = None, timeline_dir = None):
+    '''
+    Tests the robot on every maze, in parallel on a pool of processes.
+    Returns the results in the order of the mazes.
+    '''
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_test_maze_star, [(filename, timeout, seed, cache_file, repair, timeline_dir) for filename in mazes], chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def format_value(value, width, precision = 3):
+    if value is None:
+        return '-'.rjust(width)
+    if isinstance(value, float):
+        return '{:{}.{}f}'.format(value, width, precision)
+    return str(value).rjust(width)
+
+def print_results(results):
+    print '{:12} {:>4} {:>8} {:>5} {:>5} {:>8} {:>7} {:>7}  {}'.format(*columns)
+    for result in results:
+        print '{:12} {} {} {} {} {} {} {}  {}'.format(result['maze'][:12], format_value(result['dim'], 4),
+            format_value(result['score'], 8), format_value(result['run1'], 5), format_value(result['run2'], 5),
+            format_value(result['coverage'], 8), format_value(result['cpu'], 7, 2), format_value(result['wall'], 7, 2),
+            result['status'])
+    completed = [result['score'] for result in results if result['score'] is not None]
+    print '{} of {} mazes completed'.format(len(completed), len(results)),
+    if completed:
+        print 'mean score {:.3f}'.format(sum(completed) / len(completed))
+    else:
+        print
+
+def save_results(results, filename):
+    with open(filename, 'w') as f_out:
+        f_out.write(','.join(columns) + '\n')
+        for result in results:
+            f_out.write(','.join('' if result[column] is None else str(result[column]) for column in columns) + '\n')
+
+if __name__ == '__main__':
+    '''
+    This script tests the robot in robot.py on many mazes at once (by default
+    the test mazes and the MicromouseSim mazes), without visualization, and
+    prints a table of the results.
+    '''
+
+    parser = argparse.ArgumentParser(description = 'Test the robot on a set of mazes in parallel.')
+    parser.add_argument('mazes', nargs = '*', help = 'maze files (.txt, or MicromouseSim .json or .maze); default: all')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes (default: one per CPU)')
+    parser.add_argument('--timeout', type = int, default = 60, help = 'seconds allowed per maze')
+    parser.add_argument('--seed', type = int, default = 0, help = 'random seed of the robot, for every maze')
+    parser.add_argument('--cache', help = 'load the mazes from this cache file, built (or rebuilt) from them if needed')
+    parser.add_argument('--repair', choices = ['closed', 'open'], help = 'make walls the two sides disagree about closed (or open) instead of failing')
+    parser.add_argument('--timelines', help = 'save the coverage timeline of run 1 on each maze to this directory')
+    parser.add_argument('--csv', help = 'also save the results to this CSV file')
+    args = parser.parse_args()
+
+    mazes = args.mazes or default_mazes()
+    if args.cache:
+        load_cache(args.cache, mazes)
+    results = run_batch(mazes, args.processes, args.timeout, args.seed, args.cache, args.repair, args.timelines)
+    print_results(results)
+    if args.csv:
+        save_results(results, args.csv)
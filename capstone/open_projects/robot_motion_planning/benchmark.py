@@ -0,0 +1,190 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import time
+
+from maze import Maze
+from mazegen import generate_maze, maze_name
+from robot import Robot
+from tester import run_robot, score, max_time
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+baseline_file = os.path.join(project_dir, 'benchmark_baseline.json')
+
+# metrics compared against the baseline (more is worse for all of them), and
+# the smallest change in each that counts, below which timings are noise
+tracked = [('move_ms', 0.1), ('move_p95_ms', 0.2), ('run1_cpu', 0.05), ('run2_cpu', 0.05), ('maxrss_mb', 2.)]
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+def median(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return percentile(values, 0.5)
+
+def benchmark_maze(dim, braid, seed, time_limit = None):
+    '''
+    Runs a new robot, without visualization, through both runs on a
+    generated maze, allowed time_limit time steps (by default 4 per cell, and
+    no fewer than tester.py allows, so that large mazes can be explored
+    fully), and returns a dict of measurements: time steps and score,
+    the time the robot takes to choose each move (ms, mean, 95th percentile
+    and max), the CPU time of its moves in each run (s) and the peak memory
+    of the process (MB). Meant to run in a fresh process, so that the peak
+    memory is this maze's.
+    '''
+
+    if time_limit is None:
+        time_limit = max(max_time, 4 * dim * dim)
+    result = {'maze': maze_name(dim, braid, seed), 'dim': dim, 'braid': braid, 'seed': seed}
+    testmaze = Maze(walls = generate_maze(dim, seed, braid))
+    random.seed(seed)
+    testrobot = Robot(dim, visualize = False)
+
+    latencies = []
+    cpu = [0., 0.]
+    next_move = testrobot.next_move
+
+    def timed_next_move(sensors):
+        run = 1 if testrobot.control == 4 else 0
+        start_cpu = time.clock()
+        start = time.time()
+        move = next_move(sensors)
+        latencies.append((time.time() - start) * 1000.)
+        cpu[run] += time.clock() - start_cpu
+        return move
+
+    testrobot.next_move = timed_next_move
+    runtimes = run_robot(testmaze, testrobot, verbose = False, time_limit = time_limit)
+
+    result['run1'] = runtimes[0] if len(runtimes) > 0 else None
+    result['run2'] = runtimes[1] if len(runtimes) > 1 else None
+    result['score'] = score(runtimes)
+    result['coverage'] = testrobot.calculate_coverage_percentage()
+    result['moves'] = len(latencies)
+    result['move_ms'] = sum(latencies) / len(latencies)
+    result['move_p95_ms'] = percentile(latencies, 0.95)
+    result['move_max_ms'] = max(latencies)
+    result['run1_cpu'] = cpu[0]
+    result['run2_cpu'] = cpu[1] if len(runtimes) > 1 else None
+    result['maxrss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    return result
+
+def _benchmark_maze_star(args):
+    return benchmark_maze(*args)
+
+def run_benchmarks(dims, braids, seeds, time_limit = None, processes = 1):
+    '''
+    Benchmarks the robot on a generated maze for every combination of size,
+    braid and seed, each in a fresh process. Timings are only comparable
+    between runs with the same number of processes (by default one, so that
+    mazes do not compete for CPU).
+    '''
+
+    cases = [(dim, braid, seed, time_limit) for dim in dims for braid in braids for seed in seeds]
+    pool = multiprocessing.Pool(processes, maxtasksperchild = 1)
+    try:
+        return pool.map(_benchmark_maze_star, cases, chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+
+def summarize(results):
+    '''
+    The median of every tracked metric over the seeds, by maze size and
+    braid: {'<dim> <braid>': {metric: value}}.
+    '''
+
+    groups = {}
+    for result in results:
+        groups.setdefault('{} {}'.format(result['dim'], result['braid']), []).append(result)
+    return dict((key, dict((metric, median([result[metric] for result in group])) for metric, noise in tracked))
+                for key, group in groups.items())
+
+def find_regressions(summary, baseline, tolerance = 0.25):
+    '''
+    Every (group, metric, baseline value, value) where the value is more than
+    tolerance (a fraction) above the baseline, and by more than the metric's
+    noise. Groups or metrics missing from either side are skipped.
+    '''
+
+    regressions = []
+    for key in sorted(summary):
+        if key not in baseline:
+            continue
+        for metric, noise in tracked:
+            value = summary[key].get(metric)
+            base = baseline[key].get(metric)
+            if value is None or base is None:
+                continue
+            if value > base * (1 + tolerance) and value - base > noise:
+                regressions.append((key, metric, base, value))
+    return regressions
+
+def format_value(value, width, precision = 3):
+    if value is None:
+        return '-'.rjust(width)
+    if isinstance(value, float):
+        return '{:{}.{}f}'.format(value, width, precision)
+    return str(value).rjust(width)
+
+def print_results(results):
+    print '{:18} {:>5} {:>5} {:>8} {:>8} {:>7} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+        'maze', 'run1', 'run2', 'score', 'coverage', 'moves', 'move_ms', 'p95_ms', 'run1_cpu', 'run2_cpu', 'rss_mb')
+    for result in results:
+        print '{:18} {} {} {} {} {} {} {} {} {} {}'.format(result['maze'], format_value(result['run1'], 5),
+            format_value(result['run2'], 5), format_value(result['score'], 8), format_value(result['coverage'], 8),
+            format_value(result['moves'], 7), format_value(result['move_ms'], 8), format_value(result['move_p95_ms'], 8),
+            format_value(result['run1_cpu'], 8), format_value(result['run2_cpu'], 8), format_value(result['maxrss_mb'], 8, 1))
+
+if __name__ == '__main__':
+    '''
+    This script measures how the robot scales with the size of the maze, on
+    generated mazes (see mazegen.py): how long it takes to choose a move, the
+    CPU time of each run and the memory it needs. The medians over the seeds
+    are compared with a stored baseline, and the script exits with status 1
+    if any of them got worse by more than the tolerance.
+    '''
+
+    parser = argparse.ArgumentParser(description = 'Benchmark the robot on generated mazes of growing size.')
+    parser.add_argument('--dim', type = int, nargs = '+', default = [16, 32, 64], help = 'maze sizes (a 256 maze takes minutes)')
+    parser.add_argument('--braid', type = float, nargs = '+', default = [0., 0.5], help = 'braid fractions (0 for perfect mazes)')
+    parser.add_argument('--seeds', type = int, default = 3, help = 'mazes per size and braid')
+    parser.add_argument('--time-limit', type = int, help = 'time steps allowed for both runs together (default: 4 per cell)')
+    parser.add_argument('--processes', type = int, default = 1, help = 'worker processes')
+    parser.add_argument('--baseline', default = baseline_file, help = 'baseline file (JSON)')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'allowed slowdown over the baseline, as a fraction')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store these results as the new baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.dim, args.braid, range(args.seeds), args.time_limit, args.processes)
+    print_results(results)
+    summary = summarize(results)
+    settings = {'seeds': args.seeds, 'time_limit': args.time_limit, 'processes': args.processes}
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f_out:
+            json.dump({'settings': settings, 'results': summary}, f_out, indent = 2, sort_keys = True)
+        print 'Saved the baseline to {}.'.format(args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f_in:
+            baseline = json.load(f_in)
+        if baseline['settings'] != settings:
+            print 'Warning: baseline taken with other settings: {}'.format(baseline['settings'])
+        regressions = find_regressions(summary, baseline['results'], args.tolerance)
+        for key, metric, base, value in regressions:
+            dim, braid = key.split()
+            print 'REGRESSION: dim {}, braid {}: {} {:.3f} -> {:.3f}'.format(dim, braid, metric, base, value)
+        if regressions:
+            raise SystemExit(1)
+        print 'No regressions against {}.'.format(args.baseline)
+    else:
+        print 'No baseline at {}; run with --save-baseline to store one.'.format(args.baseline)
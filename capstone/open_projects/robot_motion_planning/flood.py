@@ -0,0 +1,103 @@
+import heapq
+
+from walls import DIRECTIONS, OPPOSITE, neighbor_table, open_neighbors
+
+INF = float('inf')
+
+class DistanceMap(object):
+    def __init__(self, maze_info, goals):
+        '''
+        Number of moves from every cell of the known maze to the nearest of a
+        set of goal cells, kept up to date incrementally (Lifelong Planning A*
+        without a heuristic, i.e. an incremental Dijkstra rooted at the goals).
+
+        maze_info is the robot's own wall matrix and is read, not copied: after
+        changing walls, pass the cells whose wall bits changed to update().
+        Only the cells whose distance depends on those walls are repaired, and
+        only when a distance is next asked for.
+        '''
+
+        self.maze_info = maze_info
+        self.dim = len(maze_info)
+        self.neighbors = neighbor_table(self.dim)
+        self.goals = set((goal[0], goal[1]) for goal in goals)
+        self.g = [[INF] * self.dim for i in range(self.dim)]
+        self.rhs = [[INF] * self.dim for i in range(self.dim)]
+        self.queue = []
+        for x, y in self.goals:
+            self.rhs[x][y] = 0
+            heapq.heappush(self.queue, (0, (x, y)))
+
+    def successors(self, cell):
+        '''
+        Cells the robot can move to in one step from cell, as far as it knows.
+        (order: up, right, down, left)
+        '''
+
+        x, y = cell
+        return open_neighbors(self.neighbors, self.maze_info[x][y], x, y)
+
+    def predecessors(self, cell):
+        '''
+        Cells from which the robot can move to cell in one step.
+        '''
+
+        x, y = cell
+        out = []
+        for bit in DIRECTIONS:
+            neighbor = self.neighbors[x][y][bit]
+            if neighbor is not None and self.maze_info[neighbor[0]][neighbor[1]] & OPPOSITE[bit]:
+                out.append(neighbor)
+        return out
+
+    def update_cell(self, cell):
+        x, y = cell
+        if cell not in self.goals:
+            self.rhs[x][y] = min([self.g[i][j] + 1 for i, j in self.successors(cell)] or [INF])
+        if self.g[x][y] != self.rhs[x][y]:
+            heapq.heappush(self.queue, (min(self.g[x][y], self.rhs[x][y]), cell))
+
+    def update(self, cells):
+        '''
+        Take note of cells whose wall bits changed.
+        '''
+
+        for cell in cells:
+            self.update_cell((cell[0], cell[1]))
+
+    def compute(self, target = None):
+        '''
+        Repair the distances of all cells affected by the changes so far or,
+        given a target cell, only as far as needed to settle the distance of
+        the target (and of every cell nearer to the goals); the rest is
+        picked up by later calls.
+        '''
+
+        while self.queue:
+            if target is not None:
+                g = self.g[target[0]][target[1]]
+                if g == self.rhs[target[0]][target[1]] and self.queue[0][0] >= g:
+                    break
+            key, cell = heapq.heappop(self.queue)
+            x, y = cell
+            g = self.g[x][y]
+            rhs = self.rhs[x][y]
+            if g == rhs or key != min(g, rhs):
+                continue  # already repaired, or queued again with another key
+            if g > rhs:
+                self.g[x][y] = rhs
+            else:
+                self.g[x][y] = INF
+                self.update_cell(cell)
+            for predecessor in self.predecessors(cell):
+                self.update_cell(predecessor)
+
+    def distance(self, cell):
+        '''
+        Number of moves from cell to the nearest goal cell (inf if the known
+        maze has no way there).
+        '''
+
+        if self.queue:
+            self.compute(cell)
+        return self.g[cell[0]][cell[1]]
@@ -1,7 +1,127 @@
+import json
 import numpy as np
 
+from walls import UP, RIGHT, DOWN, LEFT, BITS, DELTA, DIRECTIONS, to_masks
+
+# open sides of a cell in MicromouseSim mazes
+micromouse_bits = {'N': UP, 'E': RIGHT, 'S': DOWN, 'W': LEFT}
+
+def load_micromouse_json(filename):
+    '''
+    Reads a maze in the JSON format of MicromouseSim: a list of rows from top
+    to bottom, each cell a string of its open sides ('N', 'E', 'S', 'W'). Some
+    files pad the maze with an empty last row and column, which are dropped.
+
+    Returns the dimension and the walls as lists of masks indexed [x][y], with
+    y = 0 at the bottom, as in the text maze files.
+    '''
+    with open(filename, 'rb') as f_in:
+        rows = json.load(f_in)
+
+    while rows and not any(rows[-1]):
+        rows.pop()
+    while rows and not any(row[-1] for row in rows):
+        rows = [row[:-1] for row in rows]
+
+    dim = len(rows)
+    walls = [[sum(micromouse_bits[side] for side in rows[dim - 1 - y][x]) for y in range(dim)]
+             for x in range(dim)]
+    return dim, walls
+
+def load_micromouse_text(filename):
+    '''
+    Reads a maze in the ASCII art format of the MicromouseSim .maze files:
+    cell corners are '+', walls are '-' or '|' and open sides are spaces, with
+    the top row of cells first.
+
+    Returns the dimension and the walls as lists of masks indexed [x][y], with
+    y = 0 at the bottom, as in the text maze files.
+    '''
+    with open(filename, 'rb') as f_in:
+        lines = [line.rstrip('\r\n') for line in f_in]
+    while lines and not lines[-1].strip():
+        lines.pop()
+
+    dim = (len(lines) - 1) / 2
+    width = 2 * dim + 1
+    lines = [line.ljust(width) for line in lines]
+    walls = []
+    for x in range(dim):
+        walls.append([])
+        for y in range(dim):
+            row = 2 * (dim - 1 - y) + 1
+            col = 2 * x + 1
+            mask = 0
+            if lines[row - 1][col] == ' ':
+                mask |= UP
+            if lines[row][col + 1] == ' ':
+                mask |= RIGHT
+            if lines[row + 1][col] == ' ':
+                mask |= DOWN
+            if lines[row][col - 1] == ' ':
+                mask |= LEFT
+            walls[x].append(mask)
+    return dim, walls
+
+def load_walls(filename):
+    '''
+    Reads a maze file: MicromouseSim .json or .maze, or else the project's
+    own format (the dimension on the first line, then one line of
+    comma-separated wall masks per column). Returns the dimension and the
+    walls indexed [x][y].
+    '''
+    if filename.endswith('.json'):
+        return load_micromouse_json(filename)
+    if filename.endswith('.maze'):
+        return load_micromouse_text(filename)
+
+    with open(filename, 'rb') as f_in:
+
+        # First line should be an integer with the maze dimensions
+        dim = int(f_in.next())
+
+        # Subsequent lines describe the permissability of walls
+        walls = []
+        for line in f_in:
+            walls.append(map(int,line.split(',')))
+    return dim, walls
+
+def find_wall_errors(walls):
+    '''
+    Returns every wall that the cells on its two sides disagree about, as
+    [cell, 'v'] for the vertical wall to the right of cell and [cell, 'h'] for
+    the horizontal wall above it. Vertical walls come first, by column, then
+    horizontal walls, by row.
+    '''
+    # bit planes of the right/left and up/down sides, compared against the
+    # plane of the neighbor one cell over
+    vertical = ((walls[:-1, :] & RIGHT) != 0) != ((walls[1:, :] & LEFT) != 0)
+    horizontal = ((walls[:, :-1] & UP) != 0) != ((walls[:, 1:] & DOWN) != 0)
+    errors = [[(x, y), 'v'] for x, y in np.argwhere(vertical).tolist()]
+    errors += [[(x, y), 'h'] for y, x in np.argwhere(horizontal.T).tolist()]
+    return errors
+
+def repair_walls(walls, side):
+    '''
+    Returns a copy of walls where every inconsistent wall is either 'closed'
+    on both sides or 'open' on both sides.
+    '''
+    if side not in ('closed', 'open'):
+        raise Exception('Wall repair must be "closed" or "open", not {!r}'.format(side))
+    walls = np.array(walls, dtype = np.uint8)
+    for low, high, bit, opposite in ((walls[:-1, :], walls[1:, :], RIGHT, LEFT),
+                                     (walls[:, :-1], walls[:, 1:], UP, DOWN)):
+        mismatch = ((low & bit) != 0) != ((high & opposite) != 0)
+        if side == 'closed':
+            low[mismatch] &= ~bit & 0xf
+            high[mismatch] &= ~opposite & 0xf
+        else:
+            low[mismatch] |= bit
+            high[mismatch] |= opposite
+    return walls
+
 class Maze(object):
-    def __init__(self, filename):
+    def __init__(self, filename = None, walls = None, repair = None):
         '''
         Maze objects have two main attributes:
         - dim: mazes should be square, with sides of even length. (integer)
@@ -9,21 +129,20 @@ class Maze(object):
             0 if there is a wall and 1 if there is no wall. The 1s register
             corresponds with a square's top edge, 2s register the right edge,
             4s register the bottom edge, and 8s register the left edge. (numpy
-            array)
+            array of uint8)
 
-        The initialization function also performs some consistency checks for
-        wall positioning.
+        The maze is read from a file (see load_walls() for the formats), or
+        given directly as a walls matrix indexed [x][y]. The initialization
+        function also performs some consistency checks for wall positioning.
+        Walls that the cells on either side disagree about are an error,
+        unless repair is 'closed' or 'open': they are then made closed (or
+        open) on both sides, and listed in the attribute repaired.
         '''
-        with open(filename, 'rb') as f_in:
-
-            # First line should be an integer with the maze dimensions
-            self.dim = int(f_in.next())
-
-            # Subsequent lines describe the permissability of walls
-            walls = []
-            for line in f_in:
-                walls.append(map(int,line.split(',')))
-            self.walls = np.array(walls)
+        if walls is None:
+            self.dim, walls = load_walls(filename)
+        else:
+            self.dim = len(walls)
+        self.walls = to_masks(walls)
 
         # Perform validation on maze
         # Maze dimensions
@@ -33,19 +152,12 @@ class Maze(object):
             raise Exception('Maze shape does not match dimension attribute!')
 
         # Wall permeability
-        wall_errors = []
-        # vertical walls
-        for x in range(self.dim-1):
-            for y in range(self.dim):
-                if (self.walls[x,y] & 2 != 0) != (self.walls[x+1,y] & 8 != 0):
-                    wall_errors.append([(x,y), 'v'])
-        # horizontal walls
-        for y in range(self.dim-1):
-            for x in range(self.dim):
-                if (self.walls[x,y] & 1 != 0) != (self.walls[x,y+1] & 4 != 0):
-                    wall_errors.append([(x,y), 'h'])
-
-        if wall_errors:
+        wall_errors = find_wall_errors(self.walls)
+        self.repaired = []
+        if wall_errors and repair is not None:
+            self.walls = repair_walls(self.walls, repair)
+            self.repaired = wall_errors
+        elif wall_errors:
             for cell, wall_type in wall_errors:
                 if wall_type == 'v':
                     cell2 = (cell[0]+1, cell[1])
@@ -55,6 +167,29 @@ class Maze(object):
                     print 'Inconsistent horizontal wall betweeen {} and {}'.format(cell, cell2)
             raise Exception('Consistency errors found in wall specifications!')
 
+        # Number of open cells to the nearest wall from every cell, in every
+        # direction, for dist_to_wall(). Each table is filled with one sweep
+        # per row or column, against the direction of the rays, so that a
+        # cell extends the ray of the cell beyond it.
+        self.distances = {}
+        for bit in DIRECTIONS:
+            dx, dy = DELTA[bit]
+            is_open = (self.walls & bit) != 0
+            distance = np.zeros((self.dim, self.dim), dtype = int)
+            if dx + dy > 0:
+                lines = range(self.dim - 1, -1, -1)
+            else:
+                lines = range(self.dim)
+            for i in lines:
+                beyond = i + dx + dy
+                if dx:
+                    ray = distance[beyond, :] if 0 <= beyond < self.dim else 0
+                    distance[i, :] = is_open[i, :] * (1 + ray)
+                else:
+                    ray = distance[:, beyond] if 0 <= beyond < self.dim else 0
+                    distance[:, i] = is_open[:, i] * (1 + ray)
+            self.distances[bit] = distance
+
 
     def is_permissible(self, cell, direction):
         """
@@ -63,12 +198,12 @@ class Maze(object):
         input as single letter 'u', 'r', 'd', 'l', or complete words 'up', 
         'right', 'down', 'left'.
         """
-        dir_int = {'u': 1, 'r': 2, 'd': 4, 'l': 8,
-                   'up': 1, 'right': 2, 'down': 4, 'left': 8}
         try:
-            return (self.walls[tuple(cell)] & dir_int[direction] != 0)
-        except:
+            bit = BITS[direction]
+        except KeyError:
             print 'Invalid direction provided!'
+            return
+        return (self.walls[cell[0], cell[1]] & bit != 0)
 
 
     def dist_to_wall(self, cell, direction):
@@ -78,17 +213,9 @@ class Maze(object):
         may be input as a single letter 'u', 'r', 'd', 'l', or complete words
         'up', 'right', 'down', 'left'.
         """
-        dir_move = {'u': [0, 1], 'r': [1, 0], 'd': [0, -1], 'l': [-1, 0],
-                    'up': [0, 1], 'right': [1, 0], 'down': [0, -1], 'left': [-1, 0]}
-
-        sensing = True
-        distance = 0
-        curr_cell = list(cell) # make copy to preserve original
-        while sensing:
-            if self.is_permissible(curr_cell, direction):
-                distance += 1
-                curr_cell[0] += dir_move[direction][0]
-                curr_cell[1] += dir_move[direction][1]
-            else:
-                sensing = False
-        return distance
+        try:
+            bit = BITS[direction]
+        except KeyError:
+            print 'Invalid direction provided!'
+            return 0
+        return int(self.distances[bit][cell[0], cell[1]])
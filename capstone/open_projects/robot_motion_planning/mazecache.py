@@ -0,0 +1,116 @@
+import os
+import struct
+
+import numpy as np
+
+from maze import Maze, load_walls
+
+# A maze cache is one file holding many mazes, so that a batch of mazes can
+# be loaded without parsing text:
+#   header: MAGIC, number of mazes, offset of the index
+#   walls: for each maze, its dim x dim uint8 wall masks indexed [x][y]
+#   index: for each maze, its name (length-prefixed), dimension and the
+#          offset of its walls
+# All integers are little-endian. The walls are read through a memory map,
+# so only the mazes that are used are paged in.
+MAGIC = 'MAZECCH1'
+header_format = struct.Struct('<II')  # mazes, index offset
+entry_format = struct.Struct('<HI')  # dim, walls offset
+
+def write_cache(filename, mazes):
+    '''
+    Writes mazes, given as (name, walls) pairs with walls indexed [x][y], to
+    a cache file.
+    '''
+
+    entries = []
+    with open(filename, 'wb') as f_out:
+        f_out.write(MAGIC)
+        f_out.write(header_format.pack(0, 0))
+        for name, walls in mazes:
+            walls = np.asarray(walls, dtype = np.uint8)
+            entries.append((name, len(walls), f_out.tell()))
+            f_out.write(walls.tobytes())
+        index_offset = f_out.tell()
+        for name, dim, offset in entries:
+            f_out.write(struct.pack('<H', len(name)) + name)
+            f_out.write(entry_format.pack(dim, offset))
+        f_out.seek(len(MAGIC))
+        f_out.write(header_format.pack(len(entries), index_offset))
+
+def build_cache(filename, mazes):
+    '''
+    Writes the mazes (files in any format load_walls() reads) to a cache
+    file. Mazes are named after their files, without the directory.
+    '''
+
+    write_cache(filename, ((os.path.basename(maze_file), load_walls(maze_file)[1]) for maze_file in mazes))
+
+def is_stale(filename, mazes):
+    '''
+    True if the cache file is missing, or older than any of the mazes.
+    '''
+
+    if not os.path.exists(filename):
+        return True
+    built = os.path.getmtime(filename)
+    return any(os.path.getmtime(maze_file) > built for maze_file in mazes)
+
+class MazeCache(object):
+    def __init__(self, filename):
+        '''
+        Random access to the mazes of a cache file written by build_cache().
+        '''
+
+        self.filename = filename
+        self.index = {}
+        self.order = []
+        with open(filename, 'rb') as f_in:
+            if f_in.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{} is not a maze cache'.format(filename))
+            count, index_offset = header_format.unpack(f_in.read(header_format.size))
+            f_in.seek(index_offset)
+            for i in range(count):
+                length = struct.unpack('<H', f_in.read(2))[0]
+                name = f_in.read(length)
+                self.index[name] = entry_format.unpack(f_in.read(entry_format.size))
+                self.order.append(name)
+        self.data = np.memmap(filename, dtype = np.uint8, mode = 'r')
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self):
+        '''
+        Names of the mazes, in the order they were written.
+        '''
+
+        return list(self.order)
+
+    def walls(self, name):
+        '''
+        The wall masks of a maze, as a read-only [x][y] view into the cache.
+        '''
+
+        dim, offset = self.index[name]
+        return self.data[offset:offset + dim * dim].reshape(dim, dim)
+
+    def maze(self, name, repair = None):
+        return Maze(walls = self.walls(name), repair = repair)
+
+def load_cache(filename, mazes):
+    '''
+    Opens the cache file, first (re)building it from the mazes if it is
+    missing or out of date.
+    '''
+
+    if is_stale(filename, mazes):
+        build_cache(filename, mazes)
+    cache = MazeCache(filename)
+    if any(os.path.basename(maze_file) not in cache for maze_file in mazes):
+        build_cache(filename, mazes)
+        cache = MazeCache(filename)
+    return cache
@@ -0,0 +1,123 @@
+import argparse
+import os
+import random
+
+import numpy as np
+
+from maze import Maze
+from mazecache import write_cache
+from walls import DIRECTIONS, OPPOSITE, POPCOUNT, neighbor_table
+
+def generate_maze(dim, seed = None, braid = 0.):
+    '''
+    Generates a random dim x dim maze (dim even) and returns its walls as an
+    array of masks indexed [x][y], in the format Maze uses.
+
+    The maze is perfect (exactly one route between any two cells) and is
+    carved by a depth-first search, which makes long winding corridors. With
+    braid > 0, that fraction of the dead ends is then opened into a
+    neighboring cell, which makes loops. Either way, the layout tester.py
+    expects holds: the start cell (0, 0) is open only to the north, and the
+    four center cells form an open goal room.
+    '''
+
+    if dim % 2 or dim < 4:
+        raise Exception('Maze dimensions must be even in length, and at least 4!')
+    rng = random.Random(seed)
+    table = neighbor_table(dim)
+    walls = np.zeros((dim, dim), dtype = np.uint8)
+
+    def carve(cell, bit):
+        n = table[cell[0]][cell[1]][bit]
+        walls[cell[0], cell[1]] |= bit
+        walls[n[0], n[1]] |= OPPOSITE[bit]
+        return n
+
+    cc = dim / 2
+    room = [(cc - 1, cc - 1), (cc - 1, cc), (cc, cc - 1), (cc, cc)]
+    visited = np.zeros((dim, dim), dtype = bool)
+    for x, y in room:
+        for bit in DIRECTIONS:
+            n = table[x][y][bit]
+            if n in room:
+                walls[x, y] |= bit
+
+    # the start cell is a dead end opening north; carving goes on from there
+    visited[0, 0] = True
+    stack = [carve((0, 0), DIRECTIONS[0])]
+    visited[0, 1] = True
+    while stack:
+        cell = stack[-1]
+        options = [bit for bit in DIRECTIONS
+                   if table[cell[0]][cell[1]][bit] is not None and not visited[table[cell[0]][cell[1]][bit]]]
+        if not options:
+            stack.pop()
+            continue
+        n = carve(cell, rng.choice(options))
+        if n in room:
+            # the room is entered once, and left from any of its cells
+            for x, y in room:
+                visited[x, y] = True
+                stack.append((x, y))
+        else:
+            visited[n] = True
+            stack.append(n)
+
+    if braid > 0:
+        dead_ends = [(x, y) for x in range(dim) for y in range(dim)
+                     if POPCOUNT[walls[x, y]] == 1 and (x, y) != (0, 0)]
+        rng.shuffle(dead_ends)
+        for x, y in dead_ends[:int(round(braid * len(dead_ends)))]:
+            if POPCOUNT[walls[x, y]] > 1:
+                continue  # opened by an earlier dead end
+            options = [bit for bit in DIRECTIONS
+                       if table[x][y][bit] not in (None, (0, 0)) and not walls[x, y] & bit]
+            carve((x, y), rng.choice(options))
+
+    return walls
+
+def maze_name(dim, braid, seed):
+    '''
+    Name of a generated maze, as used for its file and in a cache.
+    '''
+
+    kind = 'braid{:02d}'.format(int(round(braid * 100))) if braid > 0 else 'perfect'
+    return '{}_{:03d}_{:04d}'.format(kind, dim, seed)
+
+def save_maze(filename, walls):
+    '''
+    Writes walls to a file in the project's own maze format.
+    '''
+
+    with open(filename, 'w') as f_out:
+        f_out.write('{}\n'.format(len(walls)))
+        for column in walls:
+            f_out.write(','.join(str(mask) for mask in column) + '\n')
+
+if __name__ == '__main__':
+    '''
+    This script generates random mazes, and saves them as maze files in a
+    directory or all together in a maze cache (see mazecache.py).
+    '''
+
+    parser = argparse.ArgumentParser(description = 'Generate random mazes.')
+    parser.add_argument('--dim', type = int, nargs = '+', default = [16], help = 'maze sizes (even, 16 to 256)')
+    parser.add_argument('--count', type = int, default = 1, help = 'mazes per size')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the first maze; the others follow on')
+    parser.add_argument('--braid', type = float, default = 0., help = 'fraction of dead ends to open into loops')
+    parser.add_argument('--out', default = '.', help = 'directory for the maze files')
+    parser.add_argument('--cache', help = 'write the mazes to this cache file instead')
+    args = parser.parse_args()
+
+    mazes = []
+    for dim in args.dim:
+        for seed in range(args.seed, args.seed + args.count):
+            walls = generate_maze(dim, seed, args.braid)
+            Maze(walls = walls)
+            mazes.append((maze_name(dim, args.braid, seed), walls))
+    if args.cache:
+        write_cache(args.cache, mazes)
+    else:
+        for name, walls in mazes:
+            save_maze(os.path.join(args.out, name + '.txt'), walls)
+    print 'Generated {} mazes.'.format(len(mazes))
@@ -2,25 +2,46 @@ import numpy as np
 import random
 import math
 import sys
-import os
-import time
+import heapq
+from collections import deque
+
+from flood import DistanceMap
+from terminal import TerminalRenderer
+from walls import UP, RIGHT, DOWN, DIRECTIONS, OPPOSITE, POPCOUNT, neighbor_table, open_neighbors
 
 class Robot(object):
-    def __init__(self, maze_dim):
+    def __init__(self, maze_dim, visualize = True):
         '''
         Use the initialization function to set up attributes that your robot
         will use to learn and navigate the maze. Some initial attributes are
         provided based on common information, including the size of the maze
         the robot is placed in.
+
+        With visualize on, the robot draws its map of the maze on the terminal
+        after every move, at most 25 moves a second (see terminal.py). With
+        it off, it neither draws nor pauses.
         '''
         
         self.location = [0, 0]
         self.heading = 'up'
         self.maze_dim = maze_dim
+        self.visualize = visualize
+        self.renderer = TerminalRenderer() if visualize else None
         #=======================================================================
+        # neighbors of every cell, by wall bit
+        self.neighbors = neighbor_table(maze_dim)
         self.known_maze = self.maze_initialization()
         self.coverage = self.coverage_initialization()
-        self.flood = np.ones((maze_dim, maze_dim), dtype = int) * 15
+        # number of cell sides seen so far (both sides of a wall count)
+        self.seen_sides = int(POPCOUNT[self.coverage].sum())
+        # cells with a side the robot has not seen yet
+        self.frontier = set(tuple(cell) for cell in np.argwhere(self.coverage < 15).tolist())
+        # cells whose walls changed on the last update of known_maze
+        self.changed_cells = []
+        # distances to the goal room, and to the current target of phase #3
+        cc = maze_dim / 2
+        self.goal_distance = DistanceMap(self.known_maze, [(cc - 1, cc - 1), (cc - 1, cc), (cc, cc - 1), (cc, cc)])
+        self.target_distance = None
         self.control = 0
         self.time = 0
         # record the time that our robot ends each exploration
@@ -28,7 +49,7 @@ class Robot(object):
         self.exploration2 = 0
         self.exploration3 = 0
         # temporary destination
-        self.tem = [0, 0]
+        self.tem = [None, None]
         # metrics
         self.num_of_moves_run1 = 0
         self.num_of_moves_run1_p1 = 0
@@ -36,8 +57,13 @@ class Robot(object):
         self.num_of_moves_run1_p3 = 0
         self.coverage_run1_p1 = 0.
         self.coverage_run1_p2 = 0.
+        # (time, phase, coverage) after the sensing of every move of run 1
+        self.coverage_timeline = []
         self.num_of_moves_run2 = 0
         self.pathlength_run2 = 0
+        # moves planned for run 2 at the end of exploration, and the next one
+        self.plan = None
+        self.plan_step = 0
         #=======================================================================
 
     def next_move(self, sensors):
@@ -65,6 +91,12 @@ class Robot(object):
         # upload the sensors' information to the robot's memory
         self.known_maze = self.update_maze_info(self.location, self.heading, sensors, self.known_maze)
         self.coverage = self.update_coverage_info(self.location, self.heading, sensors)
+        self.goal_distance.update(self.changed_cells)
+        if self.target_distance is not None:
+            self.target_distance.update(self.changed_cells)
+        self.changed_cells = []
+        if self.control < 3:
+            self.coverage_timeline.append((self.time, self.control + 1, self.calculate_coverage_percentage()))
         
         cc = self.maze_dim / 2
         
@@ -118,14 +150,7 @@ class Robot(object):
                 movement = 0
             else:
                 # flood in algorithm
-                self.flood = self.flooding(self.location)
-                routes = self.get_routes(self.known_maze, self.flood)
-                moves = self.get_moves(routes, self.location, self.heading)
-                #moves = self.moves_refinement(moves)
-                #moves = self.find_shortest_moves(moves)
-                rdm = random.choice(range(len(moves)))
-                rotation = moves[rdm][0][0]
-                movement = moves[rdm][0][1]
+                rotation, movement = self.get_first_move(self.location, self.heading, self.goal_distance, False)
         
         # exploration phase #3, roam the maze to get 100% map coverage
         elif self.control == 2:
@@ -134,24 +159,26 @@ class Robot(object):
             self.num_of_moves_run1_p3 += 1
             self.coverage_run1_p3 = self.calculate_coverage_percentage() - self.coverage_run1_p1 - self.coverage_run1_p2
             
-            if self.tem != [None, None]:
-                if self.coverage[self.tem[0]][self.tem[1]] < 15:
-                    f = self.flooding_to_other_cells(self.location, self.tem)
-                    routes = self.get_routes_from_other_cells(self.tem, self.known_maze, f)
-                    moves = self.get_moves(routes, self.location, self.heading)
-                    moves = self.moves_refinement(moves)
-                    moves = self.find_shortest_moves(moves)
-                    rdm = random.choice(range(len(moves)))
-                    rotation = moves[rdm][0][0]
-                    movement = moves[rdm][0][1]
-                else:
-                    self.tem = self.find_nearest_unreached(self.location)
-                    rotation = 0
-                    movement = 0
-            else:
+            # drop the target once all its sides are seen, or once it turns
+            # out to be walled off (so are its unseen sides)
+            if self.target_distance is not None:
+                if tuple(self.tem) not in self.frontier or self.target_distance.distance(self.location) == float('inf'):
+                    self.target_distance = None
+            if self.target_distance is None:
+                self.tem = self.find_nearest_unreached(self.location)
+                if self.tem != [None, None]:
+                    self.target_distance = DistanceMap(self.known_maze, [self.tem])
+            
+            if self.tem == [None, None]:
                 self.control += 1
                 rotation = 0
                 movement = 0
+            elif self.tem == self.location:
+                # the unseen side is behind the robot: turn to face it sideways
+                rotation = 90
+                movement = 0
+            else:
+                rotation, movement = self.get_first_move(self.location, self.heading, self.target_distance, True)
             
         # reset robot
         elif self.control == 3:
@@ -162,27 +189,26 @@ class Robot(object):
             movement = 'Reset'
             self.location = [0, 0]
             self.heading = 'up'
+            self.plan = self.plan_moves(self.location, self.heading)
+            self.plan_step = 0
             
         # 2nd run
         elif self.control == 4:
             
-            # flood in algorithm
-            self.flood = self.flooding(self.location)
-            routes = self.get_routes(self.known_maze, self.flood)
-            moves = self.get_moves(routes, self.location, self.heading)
-            moves = self.moves_refinement(moves)
-            moves = self.find_shortest_moves(moves)
-            rdm = random.choice(range(len(moves)))
-            rotation = moves[rdm][0][0]
-            movement = moves[rdm][0][1]
+            if self.plan is not None and self.plan_step < len(self.plan):
+                # replay the plan
+                rotation, movement = self.plan[self.plan_step]
+                self.plan_step += 1
+            else:
+                # flood in algorithm
+                rotation, movement = self.get_first_move(self.location, self.heading, self.goal_distance, True)
             
             self.num_of_moves_run2 += 1
             self.pathlength_run2 += abs(movement)
             
         # display the whole process on the screen
-        os.system('clear')
-        self.maze_plotter(self.known_maze, self.location, self.heading, [])
-        time.sleep(0.04)
+        if self.visualize:
+            self.renderer.draw(self.maze_frame(self.known_maze, self.location, self.heading, []))
         
         # update robot's own memory on its location ,heading, elapsed time
         if rotation != 'Reset' and movement != 'Reset':
@@ -191,172 +217,179 @@ class Robot(object):
         
         return rotation, movement
         
-    def flooding(self, robot_loc):
-        '''
-        Given the current robot location, this function assign a flood value to
-        each cell, which designate how far the 'water' flows using the Flooding
-        Algorithm. This function is for the goal room.
-        '''
-        
-        flood = np.ones((self.maze_dim, self.maze_dim), dtype = int) * (-1)
-        flood[robot_loc[0]][robot_loc[1]] = 0
-        des = self.maze_dim / 2
-        d = 1
-        while True:
-            for i in range(self.maze_dim):
-                for j in range(self.maze_dim):
-                    if(flood[i][j] != -1):
-                        continue
-                    n = self.get_neighbor_flood_value([i, j], self.known_maze, flood)
-                    if(n[0] == d - 1 or n[1] == d - 1 or n[2] == d - 1 or n[3] == d - 1):
-                        flood[i][j] = d
-                    if(flood[des-1][des-1] != -1 or flood[des-1][des] != -1 or flood[des][des-1] != -1 or flood[des][des] != -1):
-                        return flood
-            d += 1
-            
-    def flooding_to_other_cells(self, robot_loc, dest):
+    def get_route_dag(self, loc, distance_map):
         '''
-        Given the current robot location, this function assign a flood value to
-        each cell, which designate how far the 'water' flows using the Flooding
-        Algorithm. This function is for a specific cell as the destination, not
-        the goal room.
+        Given a distance map, this function collects the cells on the shortest
+        routes from the robot location to the map's goal, and for each of
+        them the next cells downhill. The cells come nearest to the goal
+        first. Returns None if the known maze has no way to the goal.
         '''
         
-        flood = np.ones((self.maze_dim, self.maze_dim), dtype = int) * (-1)
-        flood[robot_loc[0]][robot_loc[1]] = 0
-        des = self.maze_dim / 2
-        d = 1
-        while True:
-            for i in range(self.maze_dim):
-                for j in range(self.maze_dim):
-                    if(flood[i][j] != -1):
-                        continue
-                    n = self.get_neighbor_flood_value([i, j], self.known_maze, flood)
-                    if(n[0] == d - 1 or n[1] == d - 1 or n[2] == d - 1 or n[3] == d - 1):
-                        flood[i][j] = d
-                    if(flood[dest[0]][dest[1]] != -1):
-                        return flood
-            d += 1
+        start = (loc[0], loc[1])
+        if distance_map.distance(start) == float('inf'):
+            return None
+        downhill = {}
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            if cell in downhill:
+                continue
+            d = distance_map.distance(cell)
+            downhill[cell] = [n for n in distance_map.successors(cell) if distance_map.distance(n) == d - 1]
+            stack.extend(downhill[cell])
+        
+        return sorted(downhill, key = distance_map.distance), downhill
+        
+    def get_first_move(self, loc, heading, distance_map, combine_strides):
+        '''
+        Given a distance map, this function picks the robot's next move along
+        a shortest route to the map's goal, drawn uniformly at random among
+        the candidate routes, without listing the routes themselves.
+        
+        Without combine_strides, the candidates are all shortest routes and
+        the move is a single step. With it, the candidates are the shortest
+        routes that take the fewest moves when straight runs are covered in
+        strides of up to 3 cells (a run of n cells takes ceil(n / 3) moves),
+        and the move is the first stride of the route. Both are found by
+        dynamic programming over the shortest-path DAG, from the goal back
+        to the robot.
+        '''
         
-    def get_neighbors(self, loc, maze_info):
+        dag = self.get_route_dag(loc, distance_map)
+        if dag is None or not dag[1][(loc[0], loc[1])]:
+            return 0, 0
+        order, downhill = dag
+        start = (loc[0], loc[1])
+        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+        
+        if not combine_strides:
+            # number of shortest routes from each cell
+            count = {}
+            for cell in order:
+                count[cell] = sum([count[n] for n in downhill[cell]]) or 1
+            n = self.weighted_choice(downhill[start], [count[n] for n in downhill[start]])
+            return self.get_one_move(self.direction_to_vector(heading), (n[0] - start[0], n[1] - start[1]))
+        
+        # state (cell, s): having reached cell with a step in direction s // 3,
+        # with s % 3 more cells the current stride can still cover. moves[cell][s]
+        # is the fewest moves left to the goal, count[cell][s] the number of
+        # routes that take that many.
+        def step(cell, s, n):
+            d = directions.index((n[0] - cell[0], n[1] - cell[1]))
+            if s is not None and s // 3 == d and s % 3 > 0:
+                return 0, d * 3 + s % 3 - 1
+            return 1, d * 3 + 2
+        
+        moves = {}
+        count = {}
+        for cell in order:
+            if not downhill[cell]:
+                moves[cell] = [0] * 12
+                count[cell] = [1] * 12
+                continue
+            moves[cell] = [float('inf')] * 12
+            count[cell] = [0] * 12
+            for s in range(12):
+                for n in downhill[cell]:
+                    cost, t = step(cell, s, n)
+                    if cost + moves[n][t] < moves[cell][s]:
+                        moves[cell][s] = cost + moves[n][t]
+                        count[cell][s] = count[n][t]
+                    elif cost + moves[n][t] == moves[cell][s]:
+                        count[cell][s] += count[n][t]
+        
+        # draw the route one cell at a time, until the first stride ends
+        cell = start
+        s = None
+        stride = 0
+        while downhill[cell]:
+            options = [(n,) + step(cell, s, n) for n in downhill[cell]]
+            best = min([m_cost + moves[m][u] for m, m_cost, u in options])
+            options = [option for option in options if option[1] + moves[option[0]][option[2]] == best]
+            n, cost, t = self.weighted_choice(options, [count[m][u] for m, m_cost, u in options])
+            if s is not None and cost > 0:
+                break
+            if s is None:
+                first = n
+            cell = n
+            s = t
+            stride += 1
+        
+        rotation, movement = self.get_one_move(self.direction_to_vector(heading), (first[0] - start[0], first[1] - start[1]))
+        return rotation, movement * stride
+        
+    def plan_moves(self, loc, heading):
         '''
-        This function outputs all the available neighbors for a given cell, as a
-        list of tuples. (order: up, right, down, left)
+        A* search for the fewest moves from loc, with the given heading, to
+        the goal room. A state is a cell and a heading; a move is a rotation
+        of -90, 0 or +90 degrees followed by 1 to 3 cells forwards or
+        backwards, and costs one time step whatever its length; among routes
+        with the fewest moves, the fewest cells is preferred. The heuristic,
+        (cells to the goal room over 3, cells to the goal room), never
+        overestimates either.
+        
+        Only walls the robot has seen open are passed through. Returns the
+        list of (rotation, movement), or None if no route is known that way.
         '''
         
-        binary_info = '000' + bin(maze_info[loc[0]][loc[1]])[2:]
-
-        if int(binary_info[-1]):
-            u = (loc[0], loc[1] + 1)
-        else:
-            u = None
-        if int(binary_info[-2]):
-            r = (loc[0] + 1, loc[1])
-        else:
-            r = None
-        if int(binary_info[-3]):
-            d = (loc[0], loc[1] - 1)
-        else:
-            d = None
-        if int(binary_info[-4]):
-            l = (loc[0] - 1, loc[1])
-        else:
-            l = None
-        
-        return [u, r, d, l]
-        
-    def get_neighbor_flood_value(self, loc, maze_info, flood_values):
-        '''
-        This function returns all neighbor flood values.
-        '''
-        
-        out = [0, 0, 0, 0]
-        neighbors = self.get_neighbors(loc, maze_info)
-        
-        for i in range(4):
-            if neighbors[i] != None:
-                out[i] = flood_values[neighbors[i][0]][neighbors[i][1]]
-            else:
-                out[i] = None
-        return out
-        
-    def get_routes(self, maze_info, f):
-        '''
-        Given the flood values matrix, this function can generate routes leading
-        to the destination.
-        '''
-        
-        num_routes = 1
-        center = self.maze_dim / 2 - 1
-        
-        for i in range(2):
-            for j in range(2):
-                if f[center + i][center + j] != -1:
-                    N = f[center + i][center + j]
-                    # 'head' is the head of a route
-                    head = [(center + i, center + j)]
-                    routes = [[(center + i, center + j)]]
-        
-        while (N > 0):
-            N -= 1
-            for i in range(num_routes):
-                temp = self.get_neighbor_flood_value(head[i], maze_info, f)
-                nei = self.get_neighbors(head[i], maze_info)
-                ii = [x for x, y in enumerate(temp) if y == N]
-                l = len(ii)
-                if l > 1:
-                    num_routes += l - 1
-                    for j in range(l - 1):
-                        routes.append(routes[i][:])
-                        routes[-1].append(nei[ii[j + 1]])
-                        head.append(nei[ii[j + 1]])
-                head[i] = nei[ii[0]]
-                routes[i].append(nei[ii[0]])
-        
-        return routes
-        
-    def get_routes_from_other_cells(self, des, maze_info, f):
-        '''
-        Given the flood values matrix, this function can generate routes leading
-        to the destination.
-        '''
-        
-        num_routes = 1
-        N = f[des[0]][des[1]]
-        head = [(des[0], des[1])]
-        routes = [[(des[0], des[1])]]
-        
-        while (N > 0):
-            N -= 1
-            for i in range(num_routes):
-                temp = self.get_neighbor_flood_value(head[i], maze_info, f)
-                nei = self.get_neighbors(head[i], maze_info)
-                ii = [x for x, y in enumerate(temp) if y == N]
-                l = len(ii)
-                if l > 1:
-                    num_routes += l - 1
-                    for j in range(l - 1):
-                        routes.append(routes[i][:])
-                        routes[-1].append(nei[ii[j + 1]])
-                        head.append(nei[ii[j + 1]])
-                head[i] = nei[ii[0]]
-                routes[i].append(nei[ii[0]])
-        
-        return routes
-    
-    def get_moves(self, routes, loc, heading):
-        
-        moves = []
-        for i in range(len(routes)):
-            moves.append([])
-            vec = self.direction_to_vector(heading)
-            for j in range(len(routes[i]) - 1):
-                disp = (routes[i][-(j + 2)][0] - routes[i][-(j + 1)][0], routes[i][-(j + 2)][1] - routes[i][-(j + 1)][1])
-                move = self.get_one_move(vec, disp)
-                moves[i].append(move)
-                vec = self.perform_rotation(vec, -move[0]/180.*math.pi)
+        cc = self.maze_dim / 2
+        headings = ['up', 'right', 'down', 'left']
+        
+        def h(cell):
+            dx = max(cc - 1 - cell[0], cell[0] - cc, 0)
+            dy = max(cc - 1 - cell[1], cell[1] - cc, 0)
+            return ((dx + dy + 2) // 3, dx + dy)
+        
+        def is_open(cell, bit):
+            return self.known_maze[cell[0]][cell[1]] & self.coverage[cell[0]][cell[1]] & bit
+        
+        start = ((loc[0], loc[1]), headings.index(heading))
+        cost = {start: (0, 0)}
+        came_from = {start: None}
+        queue = [(h(start[0]), (0, 0), 0, start)]
+        count = 1
+        while queue:
+            f, g, order, state = heapq.heappop(queue)
+            if g > cost[state]:
+                continue
+            cell, d = state
+            if h(cell) == (0, 0):
+                plan = []
+                while came_from[state] is not None:
+                    state, move = came_from[state]
+                    plan.append(move)
+                return plan[::-1]
+            for rotation in (0, 90, -90):
+                new_d = (d + rotation // 90) % 4
+                for sign in (1, -1):
+                    bit = DIRECTIONS[new_d] if sign > 0 else OPPOSITE[DIRECTIONS[new_d]]
+                    n = cell
+                    for stride in (1, 2, 3):
+                        if not is_open(n, bit):
+                            break
+                        n = self.neighbors[n[0]][n[1]][bit]
+                        new_state = (n, new_d)
+                        new_g = (g[0] + 1, g[1] + stride)
+                        if new_state not in cost or new_g < cost[new_state]:
+                            cost[new_state] = new_g
+                            came_from[new_state] = (state, (rotation, sign * stride))
+                            f = (new_g[0] + h(n)[0], new_g[1] + h(n)[1])
+                            heapq.heappush(queue, (f, new_g, count, new_state))
+                            count += 1
+        
+        return None
+        
+    def weighted_choice(self, items, weights):
+        '''
+        Pick one of the items at random, with probability proportional to its
+        (integer) weight.
+        '''
         
-        return moves
+        r = random.randrange(sum(weights))
+        for item, weight in zip(items, weights):
+            if r < weight:
+                return item
+            r -= weight
         
     def get_one_move(self, vec, displacement):
         
@@ -406,7 +439,11 @@ class Robot(object):
         
         return vec2
         
-    def maze_plotter(self, maze_info, loc, heading, moves):
+    def maze_frame(self, maze_info, loc, heading, moves):
+        '''
+        Draw the known maze as text, one string per line, with the robot's
+        location marked 0 and the cells along the given moves numbered.
+        '''
         
         l = len(maze_info)
         path = [[-1 for i in range(l)] for j in range(l)]
@@ -425,43 +462,36 @@ class Robot(object):
                     value += 1
         
         n = len(maze_info)
+        lines = []
         for i in range(n):
             if i == 0:
-                sys.stdout.write('*')
+                line = ['*']
                 for j in range(n):
-                    bininfo = '000' + bin(maze_info[j][n - 1 - i])[2:]
-                    if int(bininfo[-1]):
-                        sys.stdout.write('   ')
-                    else:
-                        sys.stdout.write('***')
-                    sys.stdout.write('*')
-                sys.stdout.write('\n')
-            sys.stdout.write('*')
+                    line.append('   ' if maze_info[j][n - 1 - i] & UP else '***')
+                    line.append('*')
+                lines.append(''.join(line))
+            line = ['*']
             for j in range(n):
-                bininfo = '000' + bin(maze_info[j][n - 1 - i])[2:]
                 if path[j][n - 1 - i] == -1:
-                    sys.stdout.write('   ')
+                    line.append('   ')
                 elif path[j][n - 1 - i] == 0:
-                    sys.stdout.write(' 0 ')
+                    line.append(' 0 ')
                 else:
-                    #sys.stdout.write(' @ ')
-                    sys.stdout.write(str(path[j][n - 1 - i]).zfill(3))
-                    
-                if int(bininfo[-2]):
-                    sys.stdout.write(' ')
-                else:
-                    sys.stdout.write('*')
-            sys.stdout.write('\n')
-            sys.stdout.write('*')
+                    line.append(str(path[j][n - 1 - i]).zfill(3))
+                line.append(' ' if maze_info[j][n - 1 - i] & RIGHT else '*')
+            lines.append(''.join(line))
+            line = ['*']
             for j in range(n):
-                bininfo = '000' + bin(maze_info[j][n - 1 - i])[2:]
-                if int(bininfo[-3]):
-                    sys.stdout.write('   ')
-                else:
-                    sys.stdout.write('***')
-                sys.stdout.write('*')
-            sys.stdout.write('\n')
-            
+                line.append('   ' if maze_info[j][n - 1 - i] & DOWN else '***')
+                line.append('*')
+            lines.append(''.join(line))
+        
+        return lines
+        
+    def maze_plotter(self, maze_info, loc, heading, moves):
+        
+        sys.stdout.write('\n'.join(self.maze_frame(maze_info, loc, heading, moves)) + '\n')
+        
     def update_location_heading(self, loc, head, right_movement, rotation):
         '''
         This function is used to update robot's own location information.
@@ -508,36 +538,56 @@ class Robot(object):
             N = sensors[2]
         
         if N != -1:
-            maze_info[x][y + N] = maze_info[x][y + N] & 0b1110
+            self.close_wall(maze_info, x, y + N, 0b1110)
             if y + N + 1 < l:
-                maze_info[x][y + N + 1] = maze_info[x][y + N + 1] & 0b1011
+                self.close_wall(maze_info, x, y + N + 1, 0b1011)
             for i in range(N):
-                maze_info[x][y + i] = maze_info[x][y + i] | 0b0001
-                maze_info[x][y + i + 1] = maze_info[x][y + i + 1] | 0b0100
+                self.open_wall(maze_info, x, y + i, 0b0001)
+                self.open_wall(maze_info, x, y + i + 1, 0b0100)
         if E != -1:
-            maze_info[x + E][y] = maze_info[x + E][y] & 0b1101
+            self.close_wall(maze_info, x + E, y, 0b1101)
             if x + E + 1 < l:
-                maze_info[x + E + 1][y] = maze_info[x + E + 1][y] & 0b0111
+                self.close_wall(maze_info, x + E + 1, y, 0b0111)
             for i in range(E):
-                maze_info[x + i][y] = maze_info[x + i][y] | 0b0010
-                maze_info[x + i + 1][y] = maze_info[x + i + 1][y] | 0b1000
+                self.open_wall(maze_info, x + i, y, 0b0010)
+                self.open_wall(maze_info, x + i + 1, y, 0b1000)
         if S != -1:
-            maze_info[x][y - S] = maze_info[x][y - S] & 0b1011
+            self.close_wall(maze_info, x, y - S, 0b1011)
             if y - S - 1 >= 0:
-                maze_info[x][y - S - 1] = maze_info[x][y - S - 1] & 0b1110
+                self.close_wall(maze_info, x, y - S - 1, 0b1110)
             for i in range(S):
-                maze_info[x][y - i] = maze_info[x][y - i] | 0b0100
-                maze_info[x][y - i - 1] = maze_info[x][y - i - 1] | 0b0001
+                self.open_wall(maze_info, x, y - i, 0b0100)
+                self.open_wall(maze_info, x, y - i - 1, 0b0001)
         if W != -1:
-            maze_info[x - W][y] = maze_info[x - W][y] & 0b0111
+            self.close_wall(maze_info, x - W, y, 0b0111)
             if x - W - 1 >= 0:
-                maze_info[x - W - 1][y] = maze_info[x - W - 1][y] & 0b1101
+                self.close_wall(maze_info, x - W - 1, y, 0b1101)
             for i in range(W):
-                maze_info[x - i][y] = maze_info[x - i][y] | 0b1000
-                maze_info[x - i - 1][y] = maze_info[x - i - 1][y] | 0b0010
+                self.open_wall(maze_info, x - i, y, 0b1000)
+                self.open_wall(maze_info, x - i - 1, y, 0b0010)
         
         return maze_info
         
+    def close_wall(self, maze_info, x, y, mask):
+        '''
+        Clear the wall bits of a cell that are not in mask, and note the cell
+        in changed_cells if that closes a side it had open.
+        '''
+        
+        if maze_info[x][y] & (0b1111 & ~mask):
+            maze_info[x][y] = maze_info[x][y] & mask
+            self.changed_cells.append((x, y))
+        
+    def open_wall(self, maze_info, x, y, bit):
+        '''
+        Set a wall bit of a cell, and note the cell in changed_cells if that
+        opens a side it had closed.
+        '''
+        
+        if not maze_info[x][y] & bit:
+            maze_info[x][y] = maze_info[x][y] | bit
+            self.changed_cells.append((x, y))
+        
     def update_coverage_info(self, loc, heading, sensors):
         
         l = self.maze_dim
@@ -566,73 +616,56 @@ class Robot(object):
             N = sensors[2]
         
         if N != -1:
-            self.coverage[x][y + N] = self.coverage[x][y + N] | 0b0001
+            self.cover(x, y + N, 0b0001)
             if y + N + 1 < l:
-                self.coverage[x][y + N + 1] = self.coverage[x][y + N + 1] | 0b0100
+                self.cover(x, y + N + 1, 0b0100)
             for i in range(N):
-                self.coverage[x][y + i] = self.coverage[x][y + i] | 0b0001
-                self.coverage[x][y + i + 1] = self.coverage[x][y + i + 1] | 0b0100
+                self.cover(x, y + i, 0b0001)
+                self.cover(x, y + i + 1, 0b0100)
         if E != -1:
-            self.coverage[x + E][y] = self.coverage[x + E][y] | 0b0010
+            self.cover(x + E, y, 0b0010)
             if x + E + 1 < l:
-                self.coverage[x + E + 1][y] = self.coverage[x + E + 1][y] | 0b1000
+                self.cover(x + E + 1, y, 0b1000)
             for i in range(E):
-                self.coverage[x + i][y] = self.coverage[x + i][y] | 0b0010
-                self.coverage[x + i + 1][y] = self.coverage[x + i + 1][y] | 0b1000
+                self.cover(x + i, y, 0b0010)
+                self.cover(x + i + 1, y, 0b1000)
         if S != -1:
-            self.coverage[x][y - S] = self.coverage[x][y - S] | 0b0100
+            self.cover(x, y - S, 0b0100)
             if y - S - 1 >= 0:
-                self.coverage[x][y - S - 1] = self.coverage[x][y - S - 1] | 0b0001
+                self.cover(x, y - S - 1, 0b0001)
             for i in range(S):
-                self.coverage[x][y - i] = self.coverage[x][y - i] | 0b0100
-                self.coverage[x][y - i - 1] = self.coverage[x][y - i - 1] | 0b0001
+                self.cover(x, y - i, 0b0100)
+                self.cover(x, y - i - 1, 0b0001)
         if W != -1:
-            self.coverage[x - W][y] = self.coverage[x - W][y] | 0b1000
+            self.cover(x - W, y, 0b1000)
             if x - W - 1 >= 0:
-                self.coverage[x - W - 1][y] = self.coverage[x - W - 1][y] | 0b0010
+                self.cover(x - W - 1, y, 0b0010)
             for i in range(W):
-                self.coverage[x - i][y] = self.coverage[x - i][y] | 0b1000
-                self.coverage[x - i - 1][y] = self.coverage[x - i - 1][y] | 0b0010
+                self.cover(x - i, y, 0b1000)
+                self.cover(x - i - 1, y, 0b0010)
         
         return self.coverage
         
-    def moves_refinement(self, moves):
+    def cover(self, x, y, bit):
         '''
-        This function combines multiple small steps to a larger stride.
+        Mark a side of a cell as seen, and take the cell off the frontier
+        once all its sides are.
         '''
         
-        for i in range(len(moves)):
-            j = 0
-            while j < len(moves[i]) - 1:
-                if moves[i][j + 1][0] == 0 and moves[i][j][1] + moves[i][j + 1][1] <= 3 and moves[i][j][1] + moves[i][j + 1][1] >= -3:
-                        moves[i][j] = (moves[i][j][0], moves[i][j][1] + moves[i][j + 1][1])
-                        del moves[i][j + 1]
-                else:
-                    j += 1
-                    
-        return moves
-        
-    def find_shortest_moves(self, moves):
-        
-        l = []
-        for i in range(len(moves)):
-            l = l + [len(moves[i])]
-        mi = min(l)
-        n = 0
-        while n < len(moves):
-            if len(moves[n]) > mi:
-                del moves[n]
-            else:
-                n += 1
-                
-        return moves
+        seen = self.coverage[x][y]
+        new = bit & ~seen & 15
+        if new:
+            self.coverage[x][y] = seen | new
+            self.seen_sides += int(POPCOUNT[new])
+            if seen | new == 15:
+                self.frontier.discard((x, y))
         
     def maze_initialization(self):
         '''
         This function is used to initialize the maze information matrix.
         '''
         
-        maze = np.ones((self.maze_dim, self.maze_dim), dtype = int) * 15
+        maze = np.ones((self.maze_dim, self.maze_dim), dtype = np.uint8) * 15
         maze[0][0] = 3
         maze[0][self.maze_dim - 1] = 6
         maze[self.maze_dim - 1][0] = 9
@@ -650,7 +683,7 @@ class Robot(object):
         This function is used to initialize the maze coverage matrix.
         '''
         
-        co = np.zeros((self.maze_dim, self.maze_dim), dtype = int)
+        co = np.zeros((self.maze_dim, self.maze_dim), dtype = np.uint8)
         co[0][0] = 12
         co[0][self.maze_dim - 1] = 9
         co[self.maze_dim - 1][0] = 6
@@ -664,42 +697,44 @@ class Robot(object):
         return co
         
     def find_nearest_unreached(self, loc):
+        '''
+        Breadth-first search of the known maze from loc for the nearest
+        frontier cell, by number of steps. Returns [None, None] if no frontier
+        cell can be reached.
+        '''
         
-        dis = np.ones((self.maze_dim, self.maze_dim)) * float('inf')
-        
-        for i in range(self.maze_dim):
-            for j in range(self.maze_dim):
-                if self.coverage[i][j] < 15:
-                    dis[i][j] = abs(i - loc[0]) + abs(j - loc[0])
-        
-        if np.argmin(dis) > 0:
-            y = np.argmin(dis) % self.maze_dim
-            x = (np.argmin(dis) - y) / self.maze_dim
-        else:
-            x = None
-            y = None
+        start = (loc[0], loc[1])
+        seen = set([start])
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            if cell in self.frontier:
+                return [cell[0], cell[1]]
+            for n in open_neighbors(self.neighbors, self.known_maze[cell[0]][cell[1]], cell[0], cell[1]):
+                if n not in seen:
+                    seen.add(n)
+                    queue.append(n)
         
-        return [x, y]
+        return [None, None]
         
     def calculate_coverage_percentage(self):
         
         n = self.maze_dim
-        m = 0.
-        
-        for i in range(n):
-            for j in range(n):
-                bi = '000' + bin(self.coverage[i][j])[2:]
-                if int(bi[-1]):
-                    m += 1
-                if int(bi[-2]):
-                    m += 1
-                if int(bi[-3]):
-                    m += 1
-                if int(bi[-4]):
-                    m += 1
+        m = self.seen_sides
         
         return m / (n * n * 4.)
         
+    def save_coverage_timeline(self, filename):
+        '''
+        Write the coverage after every move of run 1 to a CSV file, one line
+        per move: time step, exploration phase (1 to 3) and coverage.
+        '''
+        
+        with open(filename, 'w') as f_out:
+            f_out.write('time,phase,coverage\n')
+            for t, phase, coverage in self.coverage_timeline:
+                f_out.write('{},{},{:.6f}\n'.format(t, phase, coverage))
+        
         
         
         
@@ -0,0 +1,89 @@
+import fcntl
+import struct
+import sys
+import termios
+import time
+
+# ANSI escape sequences
+CLEAR = '\x1b[H\x1b[2J'
+MOVE = '\x1b[{};{}H'  # row, column, from 1
+CLEAR_BELOW = '\x1b[J'  # from the cursor to the end of the screen
+
+# rows kept free below a frame for text printed between frames; a frame that
+# leaves fewer would have the screen scroll under it
+message_rows = 3
+
+def terminal_rows(out):
+    '''
+    Number of rows of the terminal out writes to, or None if it is not a
+    terminal.
+    '''
+
+    try:
+        rows = struct.unpack('hh', fcntl.ioctl(out.fileno(), termios.TIOCGWINSZ, '\0' * 4))[0]
+    except (AttributeError, IOError, ValueError):
+        return None
+    return rows or None
+
+class TerminalRenderer(object):
+    def __init__(self, out = sys.stdout, max_fps = 25):
+        '''
+        Draws frames (lists of lines of text) on an ANSI terminal. The first
+        frame is drawn on a cleared screen; after that only the characters
+        that differ from the frame on screen are rewritten, each run of them
+        after a cursor move. Every frame goes out in a single write, and
+        leaves the cursor below the frame with the rest of the screen
+        cleared, so text printed between frames (such as tester.py's
+        messages) stays until the next frame. A frame that does not fit on
+        the terminal with message_rows to spare is always drawn whole on a
+        cleared screen, as the screen may have scrolled since the last one.
+
+        Frames are drawn at most max_fps times a second: draw() waits out the
+        rest of the interval since the last frame (None for no limit).
+        '''
+
+        self.out = out
+        self.interval = 1. / max_fps if max_fps else 0.
+        self.screen = None
+        self.last_draw = None
+
+    def changes(self, lines, rows = None):
+        '''
+        The escape sequences and text that turn the frame on screen into this
+        one, on a terminal with the given number of rows (None if unknown).
+        '''
+
+        if self.screen is None or len(lines) != len(self.screen) or (rows is not None and len(lines) + message_rows >= rows):
+            return [CLEAR, '\n'.join(lines), '\n']
+        buf = []
+        for row, (old, new) in enumerate(zip(self.screen, lines)):
+            if old == new:
+                continue
+            if len(old) > len(new):
+                new = new.ljust(len(old))
+            old = old.ljust(len(new))
+            col = 0
+            while col < len(new):
+                if old[col] == new[col]:
+                    col += 1
+                    continue
+                end = col + 1
+                while end < len(new) and old[end] != new[end]:
+                    end += 1
+                buf.append(MOVE.format(row + 1, col + 1))
+                buf.append(new[col:end])
+                col = end
+        # leave the cursor below the frame, and clear what was printed there
+        buf.append(MOVE.format(len(lines) + 1, 1))
+        buf.append(CLEAR_BELOW)
+        return buf
+
+    def draw(self, lines):
+        if self.last_draw is not None:
+            wait = self.last_draw + self.interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        self.out.write(''.join(self.changes(lines, terminal_rows(self.out))))
+        self.out.flush()
+        self.screen = list(lines)
+        self.last_draw = time.time()
@@ -1,5 +1,6 @@
 from maze import Maze
 from robot import Robot
+from walls import BITS, DELTA
 import sys
 
 # global dictionaries for robot movement and sensing
@@ -7,8 +8,7 @@ dir_sensors = {'u': ['l', 'u', 'r'], 'r': ['u', 'r', 'd'],
                'd': ['r', 'd', 'l'], 'l': ['d', 'l', 'u'],
                'up': ['l', 'u', 'r'], 'right': ['u', 'r', 'd'],
                'down': ['r', 'd', 'l'], 'left': ['d', 'l', 'u']}
-dir_move = {'u': [0, 1], 'r': [1, 0], 'd': [0, -1], 'l': [-1, 0],
-            'up': [0, 1], 'right': [1, 0], 'down': [0, -1], 'left': [-1, 0]}
+dir_move = dict((name, list(DELTA[bit])) for name, bit in BITS.items())
 dir_reverse = {'u': 'd', 'r': 'l', 'd': 'u', 'l': 'r',
                'up': 'd', 'right': 'l', 'down': 'u', 'left': 'r'}
 
@@ -16,23 +16,24 @@ dir_reverse = {'u': 'd', 'r': 'l', 'd': 'u', 'l': 'r',
 max_time = 1000
 train_score_mult = 1/30.
 
-if __name__ == '__main__':
+def run_robot(testmaze, testrobot, verbose = True, time_limit = max_time):
     '''
-    This script tests a robot based on the code in robot.py on a maze given
-    as an argument when running the script.
+    Runs a robot through its two runs on a maze, with the same rules and time
+    limit as the script below (unless given another time_limit). Returns the
+    number of time steps each run took (the first run up to its reset); a run
+    that did not finish in time is missing from the list. With verbose off,
+    nothing is printed.
     '''
 
-    # Create a maze based on input argument on command line.
-    testmaze = Maze( str(sys.argv[1]) )
-
-    # Intitialize a robot; robot receives info about maze dimensions.
-    testrobot = Robot(testmaze.dim)
+    def say(message):
+        if verbose:
+            print message
 
     # Record robot performance over two runs.
     runtimes = []
     total_time = 0
     for run in range(2):
-        print "Starting run {}.".format(run)
+        say("Starting run {}.".format(run))
 
         # Set the robot in the start position. Note that robot position
         # parameters are independent of the robot itself.
@@ -43,9 +44,9 @@ if __name__ == '__main__':
         while run_active:
             # check for end of time
             total_time += 1
-            if total_time > max_time:
+            if total_time > time_limit:
                 run_active = False
-                print "Allotted time exceeded."
+                say("Allotted time exceeded.")
                 break
 
             # provide robot with sensor information, get actions
@@ -58,13 +59,13 @@ if __name__ == '__main__':
                 if run == 0 and hit_goal:
                     run_active = False
                     runtimes.append(total_time)
-                    print "Ending first run. Starting next run."
+                    say("Ending first run. Starting next run.")
                     break
                 elif run == 0 and not hit_goal:
-                    print "Cannot reset - robot has not hit goal yet."
+                    say("Cannot reset - robot has not hit goal yet.")
                     continue
                 else:
-                    print "Cannot reset on runs after the first."
+                    say("Cannot reset on runs after the first.")
                     continue
 
             # perform rotation
@@ -75,11 +76,11 @@ if __name__ == '__main__':
             elif rotation == 0:
                 pass
             else:
-                print "Invalid rotation value, no rotation performed."
+                say("Invalid rotation value, no rotation performed.")
 
             # perform movement
             if abs(movement) > 3:
-                print "Movement limited to three squares in a turn."
+                say("Movement limited to three squares in a turn.")
             movement = max(min(int(movement), 3), -3) # fix to range [-3, 3]
             while movement:
                 if movement > 0:
@@ -88,7 +89,7 @@ if __name__ == '__main__':
                         robot_pos['location'][1] += dir_move[robot_pos['heading']][1]
                         movement -= 1
                     else:
-                        print "Movement stopped by wall."
+                        say("Movement stopped by wall.")
                         movement = 0
                 else:
                     rev_heading = dir_reverse[robot_pos['heading']]
@@ -97,7 +98,7 @@ if __name__ == '__main__':
                         robot_pos['location'][1] += dir_move[rev_heading][1]
                         movement += 1
                     else:
-                        print "Movement stopped by wall."
+                        say("Movement stopped by wall.")
                         movement = 0
 
             # check for goal entered
@@ -107,11 +108,37 @@ if __name__ == '__main__':
                 if run != 0:
                     runtimes.append(total_time - sum(runtimes))
                     run_active = False
-                    print "Goal found; run {} completed!".format(run)
+                    say("Goal found; run {} completed!".format(run))
+
+    return runtimes
+
+def score(runtimes):
+    '''
+    Returns the score of a robot from the time steps its two runs took, or
+    None if it did not complete both runs.
+    '''
+
+    if len(runtimes) == 2:
+        return runtimes[1] + train_score_mult*runtimes[0]
+
+if __name__ == '__main__':
+    '''
+    This script tests a robot based on the code in robot.py on a maze given
+    as an argument when running the script.
+    '''
+
+    # Create a maze based on input argument on command line.
+    testmaze = Maze( str(sys.argv[1]) )
+
+    # Intitialize a robot; robot receives info about maze dimensions.
+    testrobot = Robot(testmaze.dim)
+
+    # Record robot performance over two runs.
+    runtimes = run_robot(testmaze, testrobot)
 
     # Report score if robot is successful.
     if len(runtimes) == 2:
-        print "Task complete! Score: {:4.3f}".format(runtimes[1] + train_score_mult*runtimes[0])
+        print "Task complete! Score: {:4.3f}".format(score(runtimes))
         
     print 'RUN1, PHASE1: NoM: {}, Coverage: {:.3f}, Ratio: {:.2f}.'.format(testrobot.num_of_moves_run1_p1, testrobot.coverage_run1_p1, testrobot.num_of_moves_run1_p1/testrobot.coverage_run1_p1)
     if testrobot.num_of_moves_run1_p2 > 0:
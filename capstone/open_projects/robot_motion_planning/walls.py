@@ -0,0 +1,58 @@
+import numpy as np
+
+# Walls of a cell are coded as a 4-bit mask, with a bit set if that side of
+# the cell is open (no wall).
+UP, RIGHT, DOWN, LEFT = 1, 2, 4, 8
+DIRECTIONS = [UP, RIGHT, DOWN, LEFT]
+
+# direction names used by Maze and tester.py
+BITS = {'u': UP, 'r': RIGHT, 'd': DOWN, 'l': LEFT,
+        'up': UP, 'right': RIGHT, 'down': DOWN, 'left': LEFT}
+# (dx, dy) of a move through each side
+DELTA = {UP: (0, 1), RIGHT: (1, 0), DOWN: (0, -1), LEFT: (-1, 0)}
+OPPOSITE = {UP: DOWN, RIGHT: LEFT, DOWN: UP, LEFT: RIGHT}
+
+# per wall mask: number of open sides, and the open sides in the order up,
+# right, down, left
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(16)], dtype = np.uint8)
+OPEN = [[bit for bit in DIRECTIONS if mask & bit] for mask in range(16)]
+
+_neighbor_tables = {}
+
+def to_masks(walls):
+    '''
+    Returns a wall matrix as an array of uint8 masks.
+    '''
+
+    return np.asarray(walls, dtype = np.uint8)
+
+def neighbor_table(dim):
+    '''
+    Returns a table of the neighbors of every cell of a dim x dim maze:
+    table[x][y][bit] is the cell (x', y') on that side of (x, y), or None at
+    the edge of the maze. Tables are built once per size and shared.
+    '''
+
+    if dim not in _neighbor_tables:
+        table = []
+        for x in range(dim):
+            table.append([])
+            for y in range(dim):
+                neighbors = [None] * 16
+                for bit in DIRECTIONS:
+                    i = x + DELTA[bit][0]
+                    j = y + DELTA[bit][1]
+                    if 0 <= i < dim and 0 <= j < dim:
+                        neighbors[bit] = (i, j)
+                table[x].append(neighbors)
+        _neighbor_tables[dim] = table
+    return _neighbor_tables[dim]
+
+def open_neighbors(table, walls, x, y):
+    '''
+    Returns the cells reachable in one step from (x, y), given its wall mask.
+    (order: up, right, down, left)
+    '''
+
+    neighbors = table[x][y]
+    return [neighbors[bit] for bit in OPEN[walls] if neighbors[bit] is not None]
@@ -1,16 +1,16 @@
-import random
+import numpy as np
 from environment import Agent, Environment
 from planner import RoutePlanner
 from simulator import Simulator
 
 # NEW MODULES
-from collections import defaultdict
-from operator import itemgetter
+from qtable import QTable
+from replay import ReplayBuffer
 
 class LearningAgent(Agent):
     """An agent that learns to drive in the smartcab world."""
 
-    def __init__(self, env):
+    def __init__(self, env, LR=0.9, DF=0.4, randomness=0.05, replay_capacity=0, batch_size=256, replay_period=64):
         super(LearningAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
         self.color = 'red'  # override color
         self.planner = RoutePlanner(self.env, self)  # simple route planner to get next_waypoint
@@ -18,17 +18,27 @@ class LearningAgent(Agent):
         # TODO: Initialize any additional variables here
         
         # Q value table
-        self.Q = defaultdict(dict)
+        self.Q = QTable(rng=self.env.random)
         
         # learning rate
-        self.LR = 0.9
+        self.LR = LR
         
         # discount factor
-        self.DF = 0.4
+        self.DF = DF
         
         # randomness introduced upon action selection
         # 1: totally randome; 0: no random selection
-        self.randomness = 0.05
+        self.randomness = randomness
+        
+        # experience replay (off when replay_capacity is 0): transitions are
+        # stored in a ring buffer, and every replay_period steps a minibatch
+        # of batch_size transitions is applied to the Q table at once; the
+        # minibatches are drawn from a generator seeded by the environment's
+        self.memory = None
+        if replay_capacity > 0:
+            self.memory = ReplayBuffer(replay_capacity, np.random.RandomState(self.env.random.getrandbits(32)))
+        self.batch_size = batch_size
+        self.replay_period = replay_period
         
         #
         self.penalties = 0
@@ -52,9 +62,7 @@ class LearningAgent(Agent):
         self.state = self.build_state_tuple(self.next_waypoint, inputs)
 
         # After observing a new state, update the Q table
-        if self.state != None and not(self.state in self.Q.keys()):
-            for action in self.env.valid_actions:
-                self.Q[self.state][action] = 1.
+        self.Q.visit(self.state)
         
         # TODO: Select action according to your policy
         action = self.get_next_action()
@@ -74,29 +82,16 @@ class LearningAgent(Agent):
     #===========================================================================
     def get_optimal_action(self, state):
         
-        actions = self.Q[state]
-        #return max(actions, key=actions.get)
-        optimal_actions = []
-        maxQ = max(actions.values())
-        
-        # find all the actions that have the max Q value
-        for key, value in actions.iteritems():
-            if value == maxQ:
-                optimal_actions.append(key)
-        
         # if the optimal action is not unique, randomly choose one
-        if len(optimal_actions) > 1:
-            return random.choice(optimal_actions)
-        else:
-            return optimal_actions[0]
+        return self.Q.optimal_action(state)
     
     
     def get_next_action(self):
         
         optimal_action = self.get_optimal_action(self.state)
-        if random.random() < self.randomness:
+        if self.env.random.random() < self.randomness:
             random_actions = [action for action in self.env.valid_actions if action != optimal_action]
-            return random.choice(random_actions)
+            return self.env.random.choice(random_actions)
         else:
             return optimal_action
     
@@ -109,15 +104,29 @@ class LearningAgent(Agent):
         
         # check if the 'next_waypoint' for next_state is None
         if next_waypoint2 != None:
-            if not(next_state in self.Q.keys()):
-                for action in self.env.valid_actions:
-                    self.Q[next_state][action] = 1.
-            old = self.Q[self.state][action]
-            next_optimal_action = self.get_optimal_action(next_state)
-            next_Q = self.Q[next_state][next_optimal_action]
-            self.Q[self.state][action] = (1. - self.LR) * old + self.LR * (reward + self.DF * next_Q)
+            s = self.Q.state_index[self.state]
+            a = self.Q.action_index[action]
+            s2 = self.Q.visit(next_state)
+            if self.memory is not None:
+                self.memory.add(s, a, reward, s2)
+                if self.memory.added % self.replay_period == 0:
+                    self.replay()
+                return
+            next_Q = self.Q.values[s2].max()
+            self.Q.values[s, a] = (1. - self.LR) * self.Q.values[s, a] + self.LR * (reward + self.DF * next_Q)
         else:
             return
+    
+    
+    def replay(self):
+        
+        # one vectorized Q update over a minibatch drawn from the replay memory;
+        # when a (state, action) pair is drawn twice, only one update sticks
+        i = self.memory.sample(self.batch_size)
+        s = self.memory.states[i]
+        a = self.memory.actions[i]
+        next_Q = self.Q.values[self.memory.next_states[i]].max(axis=1)
+        self.Q.values[s, a] = (1. - self.LR) * self.Q.values[s, a] + self.LR * (self.memory.rewards[i] + self.DF * next_Q)
     #===========================================================================
 
 
@@ -133,15 +142,16 @@ def run():
     # Now simulate it
     sim = Simulator(e, update_delay=0., display=False)  # create simulator (uses pygame when display=True, if available)
     # NOTE: To speed up simulation, reduce update_delay and/or set display=False
+    # (with display=False and update_delay=0, trials run headless: outcomes are collected in sim.results)
 
     sim.run(n_trials=100)  # run for a specified number of trials
     # NOTE: To quit midway, press Esc or close pygame window, or hit Ctrl+C on the command-line
     
     # print the final Q table
     q = e.primary_agent.Q
-    for i in q.keys():
-        j = q[i].keys()
-        print "({:7}, {:5}, {:7}, {:7}):{:7}:{: 0.2f},{:5}:{: 0.2f},{:4}:{: 0.2f},{:4}:{: 0.2f}".format(i[0], i[1], i[2], i[3], j[0], q[i][j[0]], j[1], q[i][j[1]], j[2], q[i][j[2]], j[3], q[i][j[3]])
+    j = q.actions
+    for i, values in q.items():
+        print "({:7}, {:5}, {:7}, {:7}):{:7}:{: 0.2f},{:5}:{: 0.2f},{:4}:{: 0.2f},{:4}:{: 0.2f}".format(i[0], i[1], i[2], i[3], j[0], values[0], j[1], values[1], j[2], values[2], j[3], values[3])
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,283 @@
+import numpy as np
+
+from environment import Environment
+from planner import RouteTable
+
+# Actions (and waypoints) are encoded as indices into Environment.valid_actions
+NONE, FORWARD, LEFT, RIGHT = range(len(Environment.valid_actions))
+
+
+class BatchEnvironment(object):
+    """Many independent smartcab worlds, stepped together with NumPy.
+
+    Each world is a copy of the grid built by Environment, with the same dummy
+    traffic, traffic rules and rewards. All per-world state lives in arrays
+    whose first axis is the world index, so every step, sense and act is a
+    handful of vectorized operations no matter how many worlds there are.
+
+    Agents are stored in the same order as Environment.agent_states: dummies
+    first, then the primary agent in the last slot.
+    """
+
+    valid_actions = Environment.valid_actions
+    valid_headings = np.array(Environment.valid_headings)  # ENWS
+    hard_time_limit = Environment.hard_time_limit
+
+    def __init__(self, n_worlds, grid_size=(8, 6), num_dummies=3, light_periods=(3, 4, 5), seed=None):
+        self.n_worlds = n_worlds
+        self.random = np.random.RandomState(seed)
+        self.status_text = ""
+
+        # Road network, shared by all worlds
+        self.grid_size = grid_size  # (cols, rows)
+        self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
+
+        # Route table as arrays: direction per axis offset, waypoint per (x direction, y direction, heading)
+        route_table = RouteTable.for_grid(self.bounds)
+        self.x_direction = np.array(route_table.x_direction)
+        self.y_direction = np.array(route_table.y_direction)
+        self.route_waypoints = np.zeros((3, 3, len(self.valid_headings)), dtype=int)
+        for (x, y, heading), waypoint in route_table.waypoints.iteritems():
+            self.route_waypoints[x + 1, y + 1, Environment.valid_headings.index(heading)] = self.valid_actions.index(waypoint)
+        self.heading_index = np.zeros((3, 3), dtype=int)  # [heading x + 1, heading y + 1] -> index into valid_headings
+        for i, heading in enumerate(Environment.valid_headings):
+            self.heading_index[heading[0] + 1, heading[1] + 1] = i
+
+        # Traffic lights, indexed by [world, x - 1, y - 1]
+        shape = (n_worlds,) + self.grid_size
+        self.light_state = self.random.randint(0, 2, size=shape).astype(bool)  # True = NS open, False = EW open
+        self.light_period = self.random.choice(light_periods, size=shape)
+        self.light_last_updated = np.zeros(shape, dtype=int)
+
+        # Agents, indexed by [world, agent]; the primary agent is the last one
+        self.num_dummies = num_dummies
+        self.num_agents = num_dummies + 1
+        self.primary = num_dummies
+        self.location = self.random_locations((n_worlds, self.num_agents))
+        self.heading = np.zeros((n_worlds, self.num_agents, 2), dtype=int)
+        self.heading[:, :] = (0, 1)
+        self.waypoint = np.zeros((n_worlds, self.num_agents), dtype=int)
+        self.waypoint[:, :self.primary] = self.random.randint(FORWARD, RIGHT + 1, size=(n_worlds, num_dummies))
+
+        # Per-world trial state
+        self.t = np.zeros(n_worlds, dtype=int)
+        self.destination = np.zeros((n_worlds, 2), dtype=int)
+        self.deadline = np.zeros(n_worlds, dtype=int)
+        self.done = np.ones(n_worlds, dtype=bool)  # no trial running until reset()
+
+        # Primary agent
+        self.primary_agent = None  # to be set explicitly
+        self.enforce_deadline = False
+
+    def set_primary_agent(self, agent, enforce_deadline=False):
+        self.primary_agent = agent
+        self.enforce_deadline = enforce_deadline
+
+    def random_locations(self, shape):
+        """Uniformly random intersections, as an array of (x, y) pairs."""
+        x = self.random.randint(self.bounds[0], self.bounds[2] + 1, size=shape)
+        y = self.random.randint(self.bounds[1], self.bounds[3] + 1, size=shape)
+        return np.stack([x, y], axis=-1)
+
+    def random_headings(self, shape):
+        return self.valid_headings[self.random.randint(0, len(self.valid_headings), size=shape)]
+
+    def reset(self, worlds=None):
+        """Start a new trial in the given worlds (a boolean mask; default: all)."""
+        # copy the mask: it may be self.done itself, which is cleared below
+        worlds = np.ones(self.n_worlds, dtype=bool) if worlds is None else np.array(worlds, dtype=bool)
+        n = np.count_nonzero(worlds)
+        if n == 0:
+            return
+
+        self.done[worlds] = False
+        self.t[worlds] = 0
+
+        # Reset traffic lights
+        self.light_last_updated[worlds] = 0
+
+        # Pick a start and a destination, redrawing the pairs that are too close
+        start = self.random_locations(n)
+        destination = self.random_locations(n)
+        too_close = self.compute_dist(start, destination) < 4
+        while too_close.any():
+            start[too_close] = self.random_locations(np.count_nonzero(too_close))
+            destination[too_close] = self.random_locations(np.count_nonzero(too_close))
+            too_close = self.compute_dist(start, destination) < 4
+
+        # Initialize agents
+        self.location[worlds, :self.primary] = self.random_locations((n, self.num_dummies))
+        self.heading[worlds, :self.primary] = self.random_headings((n, self.num_dummies))
+        self.location[worlds, self.primary] = start
+        self.heading[worlds, self.primary] = self.random_headings(n)
+        self.destination[worlds] = destination
+        self.deadline[worlds] = self.compute_dist(start, destination) * 5
+
+        if self.primary_agent is not None:
+            self.primary_agent.reset(worlds)
+
+    def step(self):
+        """Advance every world whose trial is still running by one time step."""
+        active = ~self.done
+        if not active.any():
+            return
+
+        # Update traffic lights
+        mask = active[:, None, None]
+        switch = mask & (self.t[:, None, None] - self.light_last_updated >= self.light_period)
+        self.light_state ^= switch
+        self.light_last_updated = np.where(switch, self.t[:, None, None], self.light_last_updated)
+
+        # Update agents
+        for agent in xrange(self.num_dummies):
+            self.update_dummy(agent, active)
+        if self.primary_agent is not None:
+            self.primary_agent.update(self.t)
+
+        self.t[active] += 1
+        if self.primary_agent is not None:
+            self.done |= active & (self.deadline <= self.hard_time_limit)
+            if self.enforce_deadline:
+                self.done |= active & (self.deadline <= 0)
+            self.deadline[active] -= 1
+
+    def light(self, agent=None):
+        """Whether the light facing the agent is green, per world."""
+        agent = self.primary if agent is None else agent
+        location = self.location[:, agent]
+        heading = self.heading[:, agent]
+        state = self.light_state[np.arange(self.n_worlds), location[:, 0] - self.bounds[0], location[:, 1] - self.bounds[1]]
+        return (state & (heading[:, 1] != 0)) | (~state & (heading[:, 0] != 0))
+
+    def sense(self, agent=None):
+        """Inputs seen by the agent (default: the primary agent) in every world.
+
+        Returns a dict with the same keys as Environment.sense(): 'light' is a
+        boolean array (True = green), the others are arrays of action indices.
+        """
+        agent = self.primary if agent is None else agent
+        location = self.location[:, agent]
+        heading = self.heading[:, agent]
+
+        # Populate oncoming, left, right, visiting the other agents in order
+        oncoming = np.zeros(self.n_worlds, dtype=int)
+        left = np.zeros(self.n_worlds, dtype=int)
+        right = np.zeros(self.n_worlds, dtype=int)
+        for other in xrange(self.num_agents):
+            if other == agent:
+                continue
+            other_heading = self.heading[:, other]
+            other_waypoint = self.waypoint[:, other]
+            present = (self.location[:, other] == location).all(axis=1) & (other_heading != heading).any(axis=1)
+            is_oncoming = present & ((heading * other_heading).sum(axis=1) == -1)
+            is_right = present & ~is_oncoming & (heading[:, 1] == other_heading[:, 0]) & (-heading[:, 0] == other_heading[:, 1])
+            is_left = present & ~is_oncoming & ~is_right
+            oncoming = np.where(is_oncoming & (oncoming != LEFT), other_waypoint, oncoming)
+            right = np.where(is_right & (right != FORWARD) & (right != LEFT), other_waypoint, right)
+            left = np.where(is_left & (left != FORWARD), other_waypoint, left)
+
+        return {'light': self.light(agent), 'oncoming': oncoming, 'left': left, 'right': right}
+
+    def next_waypoint(self):
+        """Route the primary agent towards its destination, as RoutePlanner does.
+
+        The result is also stored as the primary agent's waypoint, which is
+        what other agents sense and what act() rewards.
+        """
+        location = self.location[:, self.primary]
+        heading = self.heading[:, self.primary]
+        delta = self.destination - location
+        waypoint = self.route_waypoints[
+            self.x_direction[delta[:, 0] + self.grid_size[0] - 1] + 1,
+            self.y_direction[delta[:, 1] + self.grid_size[1] - 1] + 1,
+            self.heading_index[heading[:, 0] + 1, heading[:, 1] + 1]]
+
+        self.waypoint[:, self.primary] = waypoint
+        return waypoint
+
+    def get_deadline(self):
+        return self.deadline
+
+    def act(self, actions, agent=None, worlds=None):
+        """Apply one action per world for the agent (default: the primary agent).
+
+        Worlds outside the mask (default: those with a running trial) are left
+        untouched and get a reward of 0.
+        """
+        agent = self.primary if agent is None else agent
+        worlds = ~self.done if worlds is None else worlds
+        actions = np.asarray(actions)
+
+        location = self.location[:, agent]
+        heading = self.heading[:, agent]
+        inputs = self.sense(agent)
+        light = inputs['light']
+
+        # Move agent if it obeys traffic rules
+        move_okay = np.ones(self.n_worlds, dtype=bool)
+        move_okay[actions == FORWARD] = light[actions == FORWARD]
+        is_left = actions == LEFT
+        move_okay[is_left] = (light & ((inputs['oncoming'] == NONE) | (inputs['oncoming'] == LEFT)))[is_left]
+        # A right turn is always allowed: Environment.act() checks sense['left'] != 'straight', which never occurs
+
+        new_heading = heading.copy()
+        new_heading[is_left] = np.stack([heading[:, 1], -heading[:, 0]], axis=1)[is_left]
+        is_right = actions == RIGHT
+        new_heading[is_right] = np.stack([-heading[:, 1], heading[:, 0]], axis=1)[is_right]
+
+        moved = worlds & move_okay & (actions != NONE)
+        new_location = location + new_heading
+        new_location[:, 0] = (new_location[:, 0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0]  # wrap-around
+        new_location[:, 1] = (new_location[:, 1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1]
+        self.location[moved, agent] = new_location[moved]
+        self.heading[moved, agent] = new_heading[moved]
+
+        reward = np.where(move_okay,
+            np.where(actions != NONE, np.where(actions == self.waypoint[:, agent], 2.0, -0.5), 0.0),
+            -1.0)
+        reward[~worlds] = 0.0
+
+        if agent == self.primary:
+            arrived = worlds & (self.location[:, agent] == self.destination).all(axis=1)
+            reward[arrived & (self.deadline >= 0)] += 10  # bonus
+            self.done |= arrived
+
+        return reward
+
+    def update_dummy(self, agent, worlds):
+        """Vectorized DummyAgent.update() for one dummy slot."""
+        inputs = self.sense(agent)
+        light = inputs['light']
+        waypoint = self.waypoint[:, agent]
+
+        action_okay = np.ones(self.n_worlds, dtype=bool)
+        action_okay &= ~((waypoint == RIGHT) & ~light & (inputs['left'] == FORWARD))
+        action_okay &= ~((waypoint == FORWARD) & ~light)
+        action_okay &= ~((waypoint == LEFT) & (~light | (inputs['oncoming'] == FORWARD) | (inputs['oncoming'] == RIGHT)))
+
+        actions = np.where(action_okay, waypoint, NONE)
+        renew = worlds & action_okay
+        self.waypoint[renew, agent] = self.random.randint(FORWARD, RIGHT + 1, size=np.count_nonzero(renew))
+        self.act(actions, agent=agent, worlds=worlds)
+
+    def compute_dist(self, a, b):
+        """L1 distance between two arrays of points."""
+        return np.abs(b - a).sum(axis=-1)
+
+
+class BatchAgent(object):
+    """Base class for primary agents driven by a BatchEnvironment.
+
+    The environment calls reset() with the mask of worlds starting a new
+    trial, and update() once per step; update() is expected to call env.act()
+    with one action per world.
+    """
+
+    def __init__(self, env):
+        self.env = env
+
+    def reset(self, worlds):
+        pass
+
+    def update(self, t):
+        pass
@@ -1,26 +1,128 @@
 import time
 import random
-from collections import OrderedDict
+import bisect
+import numpy as np
+from collections import OrderedDict, defaultdict
 
 from simulator import Simulator
 
 class TrafficLight(object):
-    """A traffic light that switches periodically."""
+    """A traffic light that switches periodically.
+
+    A view onto one intersection of a TrafficLightGrid, which holds the
+    actual state of all lights.
+    """
 
     valid_states = [True, False]  # True = NS open, False = EW open
 
-    def __init__(self, state=None, period=None):
-        self.state = state if state is not None else random.choice(self.valid_states)
-        self.period = period if period is not None else random.choice([3, 4, 5])
-        self.last_updated = 0
+    def __init__(self, lights, intersection):
+        self.lights = lights
+        self.index = (intersection[0] - lights.bounds[0], intersection[1] - lights.bounds[1])
+
+    @property
+    def state(self):
+        return self.lights.state_at(self.index)
+
+    @state.setter
+    def state(self, state):
+        self.lights.state[self.index] = state != self.lights.switched(self.index)
+
+    @property
+    def period(self):
+        return self.lights.period.item(self.index)
+
+    @property
+    def last_updated(self):
+        return self.lights.t - self.lights.t % self.period
+
+    def reset(self):
+        pass  # lights are reset together by TrafficLightGrid.reset()
+
+    def update(self, t):
+        pass  # lights are updated together by TrafficLightGrid.update()
+
+
+class TrafficLightGrid(object):
+    """The traffic lights of a road network, as arrays indexed by intersection.
+
+    Behaves like a read-only dict from intersection to TrafficLight. Each
+    light is stored as its state at the start of the trial and its period:
+    a light switches every period steps, so its state at time t is the start
+    state flipped (t // period) times. Lights are only evaluated when an
+    agent (or the display) looks at them, and stepping the whole grid is
+    O(1).
+    """
+
+    def __init__(self, bounds, periods=(3, 4, 5), rng=random):
+        # periods are stored (and traced) as one byte each
+        if not all(1 <= period <= 255 for period in periods):
+            raise ValueError("Light periods must be between 1 and 255 steps, got {}".format(periods))
+        self.bounds = bounds
+        self.random = rng
+        shape = (bounds[2] - bounds[0] + 1, bounds[3] - bounds[1] + 1)
+        rng = np.random.RandomState(self.random.getrandbits(32))
+        self.state = rng.randint(0, 2, size=shape).astype(bool)  # state at t = 0
+        self.period = rng.choice(periods, size=shape).astype(np.uint8)
+        self.t = 0  # time of the last update
+
+    def __len__(self):
+        return self.state.size
+
+    def __contains__(self, intersection):
+        return self.bounds[0] <= intersection[0] <= self.bounds[2] and self.bounds[1] <= intersection[1] <= self.bounds[3]
+
+    def __getitem__(self, intersection):
+        if intersection not in self:
+            raise KeyError(intersection)
+        return TrafficLight(self, intersection)
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def iterkeys(self):
+        for x in xrange(self.bounds[0], self.bounds[2] + 1):
+            for y in xrange(self.bounds[1], self.bounds[3] + 1):
+                yield (x, y)
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def itervalues(self):
+        for intersection in self.iterkeys():
+            yield self[intersection]
+
+    def iteritems(self):
+        for intersection in self.iterkeys():
+            yield intersection, self[intersection]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def random_intersection(self):
+        return (self.random.randint(self.bounds[0], self.bounds[2]), self.random.randint(self.bounds[1], self.bounds[3]))
+
+    def switched(self, index):
+        """Whether the light at an array index is flipped from its start state."""
+        return (self.t // self.period.item(index)) % 2 == 1
+
+    def state_at(self, index):
+        return self.state.item(index) != self.switched(index)
+
+    def get_state(self, intersection):
+        """Current state of the light at an intersection (True = NS open)."""
+        return self.state_at((intersection[0] - self.bounds[0], intersection[1] - self.bounds[1]))
+
+    def states(self):
+        """Current state of every light, as an array indexed like self.state."""
+        return self.state ^ ((self.t // self.period) % 2 == 1)
 
     def reset(self):
-        self.last_updated = 0
+        # lights keep their state from one trial to the next
+        self.state = self.states()
+        self.t = 0
 
     def update(self, t):
-        if t - self.last_updated >= self.period:
-            self.state = not self.state  # assuming state is boolean
-            self.last_updated = t
+        self.t = t
 
 
 class Environment(object):
@@ -31,31 +133,32 @@ class Environment(object):
     valid_headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # ENWS
     hard_time_limit = -100  # even if enforce_deadline is False, end trial when deadline reaches this value (to avoid deadlocks)
 
-    def __init__(self):
+    def __init__(self, grid_size=(8, 6), num_dummies=3, light_periods=(3, 4, 5), seed=None):
         self.done = False
         self.t = 0
+
+        # All randomness in a run (lights, trials, dummy agents, action
+        # selection) comes from this generator. Each trial reseeds it with a
+        # seed of its own, recorded in trial_seed, so that a trial can be
+        # reproduced from that seed and the state carried over from earlier
+        # trials. Without a seed, the run follows the random module's seed.
+        self.random = random.Random(seed if seed is not None else random.getrandbits(64))
+        self.trial_seed = None
         self.agent_states = OrderedDict()
+        self.occupancy = defaultdict(list)  # (location, heading) -> [(order, agent)], sorted in agent_states order
+        self.agent_order = {}
         self.status_text = ""
+        self.verbose = True  # print trial events to stdout
+        self.trial_data = {}  # outcome of the current trial for the primary agent
 
         # Road network
-        self.grid_size = (8, 6)  # (cols, rows)
+        self.grid_size = grid_size  # (cols, rows)
         self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
         self.block_size = 100
-        self.intersections = OrderedDict()
-        self.roads = []
-        for x in xrange(self.bounds[0], self.bounds[2] + 1):
-            for y in xrange(self.bounds[1], self.bounds[3] + 1):
-                self.intersections[(x, y)] = TrafficLight()  # a traffic light at each intersection
-
-        for a in self.intersections:
-            for b in self.intersections:
-                if a == b:
-                    continue
-                if (abs(a[0] - b[0]) + abs(a[1] - b[1])) == 1:  # L1 distance = 1
-                    self.roads.append((a, b))
+        self.intersections = TrafficLightGrid(self.bounds, light_periods, self.random)  # a traffic light at each intersection
 
         # Dummy agents
-        self.num_dummies = 3  # no. of dummy agents
+        self.num_dummies = num_dummies  # no. of dummy agents
         for i in xrange(self.num_dummies):
             self.create_agent(DummyAgent)
 
@@ -65,51 +168,69 @@ class Environment(object):
 
     def create_agent(self, agent_class, *args, **kwargs):
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'location': random.choice(self.intersections.keys()), 'heading': (0, 1)}
+        self.agent_order[agent] = len(self.agent_order)
+        self.agent_states[agent] = {'location': self.intersections.random_intersection(), 'heading': (0, 1)}
+        self.occupy(agent)
         return agent
 
+    @property
+    def roads(self):
+        return list(self.iter_roads())
+
+    def iter_roads(self):
+        """Roads between neighboring intersections, each listed once."""
+        for x in xrange(self.bounds[0], self.bounds[2] + 1):
+            for y in xrange(self.bounds[1], self.bounds[3] + 1):
+                if x < self.bounds[2]:
+                    yield ((x, y), (x + 1, y))
+                if y < self.bounds[3]:
+                    yield ((x, y), (x, y + 1))
+
     def set_primary_agent(self, agent, enforce_deadline=False):
         self.primary_agent = agent
         self.enforce_deadline = enforce_deadline
 
     def reset(self):
+        self.trial_seed = self.random.getrandbits(32)
+        self.random.seed(self.trial_seed)
         self.done = False
         self.t = 0
+        self.trial_data = {'success': False, 'net_reward': 0.0, 'penalties': 0}
 
         # Reset traffic lights
-        for traffic_light in self.intersections.itervalues():
-            traffic_light.reset()
+        self.intersections.reset()
 
         # Pick a start and a destination
-        start = random.choice(self.intersections.keys())
-        destination = random.choice(self.intersections.keys())
+        start = self.intersections.random_intersection()
+        destination = self.intersections.random_intersection()
 
         # Ensure starting location and destination are not too close
         while self.compute_dist(start, destination) < 4:
-            start = random.choice(self.intersections.keys())
-            destination = random.choice(self.intersections.keys())
+            start = self.intersections.random_intersection()
+            destination = self.intersections.random_intersection()
 
-        start_heading = random.choice(self.valid_headings)
+        start_heading = self.random.choice(self.valid_headings)
         deadline = self.compute_dist(start, destination) * 5
         #=======================================================================
         #print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
         #=======================================================================
 
         # Initialize agent(s)
+        self.occupancy.clear()
         for agent in self.agent_states.iterkeys():
             self.agent_states[agent] = {
-                'location': start if agent is self.primary_agent else random.choice(self.intersections.keys()),
-                'heading': start_heading if agent is self.primary_agent else random.choice(self.valid_headings),
+                'location': start if agent is self.primary_agent else self.intersections.random_intersection(),
+                'heading': start_heading if agent is self.primary_agent else self.random.choice(self.valid_headings),
                 'destination': destination if agent is self.primary_agent else None,
                 'deadline': deadline if agent is self.primary_agent else None}
+            self.occupy(agent)
             agent.reset(destination=(destination if agent is self.primary_agent else None))
 
     def step(self):
         #print "Environment.step(): t = {}".format(self.t)  # [debug]
 
         # Update traffic lights
-        for intersection, traffic_light in self.intersections.iteritems():
-            traffic_light.update(self.t)
+        self.intersections.update(self.t)
 
         # Update agents
         for agent in self.agent_states.iterkeys():
@@ -120,10 +241,12 @@ class Environment(object):
             agent_deadline = self.agent_states[self.primary_agent]['deadline']
             if agent_deadline <= self.hard_time_limit:
                 self.done = True
-                print "Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit)
+                if self.verbose:
+                    print "Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit)
             elif self.enforce_deadline and agent_deadline <= 0:
                 self.done = True
-                print "Environment.step(): Primary agent ran out of time! Trial aborted."
+                if self.verbose:
+                    print "Environment.step(): Primary agent ran out of time! Trial aborted."
             self.agent_states[self.primary_agent]['deadline'] = agent_deadline - 1
 
     def sense(self, agent):
@@ -132,25 +255,22 @@ class Environment(object):
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        light_state = self.intersections.get_state(location)
+        light = 'green' if (light_state and heading[1] != 0) or ((not light_state) and heading[0] != 0) else 'red'
 
-        # Populate oncoming, left, right
+        # Populate oncoming, left, right from the cars waiting at the same intersection
         oncoming = None
-        left = None
+        for order, other_agent in self.occupancy.get((location, (-heading[0], -heading[1])), ()):
+            if oncoming != 'left':  # we don't want to override oncoming == 'left'
+                oncoming = other_agent.get_next_waypoint()
         right = None
-        for other_agent, other_state in self.agent_states.iteritems():
-            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
-                continue
-            other_heading = other_agent.get_next_waypoint()
-            if (heading[0] * other_state['heading'][0] + heading[1] * other_state['heading'][1]) == -1:
-                if oncoming != 'left':  # we don't want to override oncoming == 'left'
-                    oncoming = other_heading
-            elif (heading[1] == other_state['heading'][0] and -heading[0] == other_state['heading'][1]):
-                if right != 'forward' and right != 'left':  # we don't want to override right == 'forward or 'left'
-                    right = other_heading
-            else:
-                if left != 'forward':  # we don't want to override left == 'forward'
-                    left = other_heading
+        for order, other_agent in self.occupancy.get((location, (heading[1], -heading[0])), ()):
+            if right != 'forward' and right != 'left':  # we don't want to override right == 'forward or 'left'
+                right = other_agent.get_next_waypoint()
+        left = None
+        for order, other_agent in self.occupancy.get((location, (-heading[1], heading[0])), ()):
+            if left != 'forward':  # we don't want to override left == 'forward'
+                left = other_agent.get_next_waypoint()
 
         return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}  # TODO: make this a namedtuple
 
@@ -164,7 +284,8 @@ class Environment(object):
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        light_state = self.intersections.get_state(location)
+        light = 'green' if (light_state and heading[1] != 0) or ((not light_state) and heading[0] != 0) else 'red'
         sense = self.sense(agent)
 
         # Move agent if within bounds and obeys traffic rules
@@ -191,8 +312,10 @@ class Environment(object):
                 location = ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
                             (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
                 #if self.bounds[0] <= location[0] <= self.bounds[2] and self.bounds[1] <= location[1] <= self.bounds[3]:  # bounded
+                self.vacate(agent)
                 state['location'] = location
                 state['heading'] = heading
+                self.occupy(agent)
                 reward = 2.0 if action == agent.get_next_waypoint() else -0.5  # valid, but is it correct? (as per waypoint)
             else:
                 # Valid null move
@@ -206,12 +329,30 @@ class Environment(object):
                 if state['deadline'] >= 0:
                     reward += 10  # bonus
                 self.done = True
-                print "Environment.act(): Primary agent has reached destination!"  # [debug]
+                self.trial_data['success'] = True
+                if self.verbose:
+                    print "Environment.act(): Primary agent has reached destination!"  # [debug]
+            self.trial_data['net_reward'] += reward
+            if reward < 0:
+                self.trial_data['penalties'] += 1
             self.status_text = "state: {}\naction: {}\nreward: {}".format(agent.get_state(), action, reward)
             #print "Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward)  # [debug]
 
         return reward
 
+    def occupy(self, agent):
+        """Add an agent to the occupancy index at its current location and heading."""
+        state = self.agent_states[agent]
+        bisect.insort(self.occupancy[(state['location'], state['heading'])], (self.agent_order[agent], agent))
+
+    def vacate(self, agent):
+        """Remove an agent from the occupancy index, before it moves."""
+        state = self.agent_states[agent]
+        key = (state['location'], state['heading'])
+        self.occupancy[key].remove((self.agent_order[agent], agent))
+        if not self.occupancy[key]:
+            del self.occupancy[key]
+
     def compute_dist(self, a, b):
         """L1 distance between two points."""
         return abs(b[0] - a[0]) + abs(b[1] - a[1])
@@ -244,8 +385,8 @@ class DummyAgent(Agent):
 
     def __init__(self, env):
         super(DummyAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
-        self.next_waypoint = random.choice(Environment.valid_actions[1:])
-        self.color = random.choice(self.color_choices)
+        self.next_waypoint = self.env.random.choice(Environment.valid_actions[1:])
+        self.color = self.env.random.choice(self.color_choices)
 
     def update(self, t):
         inputs = self.env.sense(self)
@@ -264,7 +405,7 @@ class DummyAgent(Agent):
         action = None
         if action_okay:
             action = self.next_waypoint
-            self.next_waypoint = random.choice(Environment.valid_actions[1:])
+            self.next_waypoint = self.env.random.choice(Environment.valid_actions[1:])
         reward = self.env.act(self, action)
         #print "DummyAgent.update(): t = {}, inputs = {}, action = {}, reward = {}".format(t, inputs, action, reward)  # [debug]
         #print "DummyAgent.update(): next_waypoint = {}".format(self.next_waypoint)  # [debug]
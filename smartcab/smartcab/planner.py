@@ -1,34 +1,81 @@
-import random
+from environment import Environment
 
 class RoutePlanner(object):
     """Silly route planner that is meant for a perpendicular grid network."""
 
-    def __init__(self, env, agent):
+    def __init__(self, env, agent, wrap=False):
         self.env = env
         self.agent = agent
         self.destination = None
+        self.route_table = RouteTable.for_grid(env.bounds, wrap)  # wrap=True: take the shorter way round the grid
 
     def route_to(self, destination=None):
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
+        self.destination = destination if destination is not None else self.env.intersections.random_intersection()
         #=======================================================================
         #print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
         #=======================================================================
 
     def next_waypoint(self):
-		
+
 		# agent states: location + heading
-        location = self.env.agent_states[self.agent]['location']
-        heading = self.env.agent_states[self.agent]['heading']
-        
+        state = self.env.agent_states[self.agent]
+        return self.route_table.next_waypoint(state['location'], state['heading'], self.destination)
+
+
+class RouteTable(object):
+    """Precomputed next waypoints for every agent on a grid of a given size.
+
+    The waypoint only depends on which way the destination lies along each
+    axis, so the table stores the direction (-1, 0 or 1) for every possible
+    offset along x and y, plus the waypoint for every (x direction,
+    y direction, heading). A query for any (location, heading, destination)
+    is then a couple of list lookups, and the table stays linear in the
+    grid size. Tables are built once per grid and shared by all planners.
+    """
+
+    cache = {}  # (bounds, wrap) -> RouteTable
+
+    def __init__(self, bounds, wrap=False):
+        self.bounds = bounds
+        self.wrap = wrap
+        self.cols = bounds[2] - bounds[0] + 1
+        self.rows = bounds[3] - bounds[1] + 1
+
+        # direction along each axis, indexed by offset + size - 1
+        self.x_direction = [self.direction(delta, self.cols, wrap) for delta in xrange(1 - self.cols, self.cols)]
+        self.y_direction = [self.direction(delta, self.rows, wrap) for delta in xrange(1 - self.rows, self.rows)]
+
+        self.waypoints = {}
+        for x in (-1, 0, 1):
+            for y in (-1, 0, 1):
+                for heading in Environment.valid_headings:
+                    self.waypoints[(x, y, heading)] = self.plan((x, y), heading)
+
+    @classmethod
+    def for_grid(cls, bounds, wrap=False):
+        if (bounds, wrap) not in cls.cache:
+            cls.cache[(bounds, wrap)] = cls(bounds, wrap)
+        return cls.cache[(bounds, wrap)]
+
+    @staticmethod
+    def direction(delta, size, wrap):
+        """Which way to go along an axis to cover an offset (-1, 0 or 1).
+
+        With wrap-around, the agent goes the other way round the grid when
+        that is strictly shorter, as Environment.act() wraps at the bounds.
+        """
+        if wrap and 2 * abs(delta) > size:
+            delta = -delta
+        return (delta > 0) - (delta < 0)
+
+    @staticmethod
+    def plan(delta, heading):
+
         # whether or not agent reaches destination
-        delta = (self.destination[0] - location[0], self.destination[1] - location[1])
-        
-        # different cases
-        
         if delta[0] == 0 and delta[1] == 0:
 			# agent arrives destination
             return None
-            
+
         elif delta[0] != 0:  # EW difference
             if delta[0] * heading[0] > 0:  # facing correct EW direction
                 return 'forward'
@@ -38,7 +85,7 @@ class RoutePlanner(object):
                 return 'left'
             else:
                 return 'right'
-            
+
         elif delta[1] != 0:  # NS difference (turn logic is slightly different)
             if delta[1] * heading[1] > 0:  # facing correct NS direction
                 return 'forward'
@@ -48,3 +95,8 @@ class RoutePlanner(object):
                 return 'right'
             else:
                 return 'left'
+
+    def next_waypoint(self, location, heading, destination):
+        return self.waypoints[(self.x_direction[destination[0] - location[0] + self.cols - 1],
+                               self.y_direction[destination[1] - location[1] + self.rows - 1],
+                               heading)]
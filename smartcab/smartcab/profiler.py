@@ -0,0 +1,147 @@
+import time
+from collections import defaultdict
+
+_missing = object()  # no instance attribute to restore
+
+
+class Profiler(object):
+    """Opt-in timing of the simulation hot path, per phase and per trial.
+
+    attach() shadows the instrumented methods of an environment and its
+    agents with timing wrappers set on the instances; detach() puts back what
+    was there before. A wrapper that something else has wrapped again since
+    is left in place, and just passes calls through once detached. Nothing
+    is wrapped unless a profiler is attached, so leaving this module in place
+    costs nothing when profiling is off.
+
+    Phases are named after what they time: step, lights, dummies, primary,
+    sense, select (action selection), act and update_Q. They nest the way
+    the calls do, e.g. step;primary;act;sense.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.wrapped = []  # (object, method name, previous instance attribute, wrapper)
+        self.attached = False
+        self.env = None
+        self.stack = []  # [phase, start time, time spent in children]
+        self.self_time = defaultdict(float)  # call stack (tuple of phases) -> exclusive time
+        self.trials = []  # per-trial summaries
+        self.trial = None  # summary of the trial in progress
+
+    def attach(self, env):
+        """Instrument env and the agents it has now; returns self."""
+        self.env = env
+        self.attached = True
+        self.wrap(env, 'reset', 'reset', self.start_trial)
+        self.wrap(env, 'step', 'step')
+        self.wrap(env.intersections, 'update', 'lights')
+        self.wrap(env, 'sense', 'sense')
+        self.wrap(env, 'act', 'act')
+        for agent in env.agent_states:
+            if agent is env.primary_agent:
+                self.wrap(agent, 'update', 'primary')
+                if hasattr(agent, 'get_next_action'):
+                    self.wrap(agent, 'get_next_action', 'select')
+                if hasattr(agent, 'update_Q'):
+                    self.wrap(agent, 'update_Q', 'update_Q')
+            else:
+                self.wrap(agent, 'update', 'dummies')
+        return self
+
+    def detach(self):
+        """Remove all wrappers and close the trial in progress."""
+        self.end_trial()
+        self.attached = False
+        for obj, name, previous, wrapper in reversed(self.wrapped):
+            if obj.__dict__.get(name) is not wrapper:
+                continue  # wrapped again since: stays in the chain, passing calls through
+            if previous is _missing:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, previous)
+        self.wrapped = []
+
+    def wrap(self, obj, name, phase, before=None):
+        method = getattr(obj, name)
+        previous = obj.__dict__.get(name, _missing)
+        enter = self.enter
+        leave = self.leave
+
+        def timed(*args, **kwargs):
+            if not self.attached:
+                return method(*args, **kwargs)
+            if before is not None:
+                before()
+            enter(phase)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                leave()
+
+        setattr(obj, name, timed)
+        self.wrapped.append((obj, name, previous, timed))
+
+    def enter(self, phase):
+        self.stack.append([phase, self.clock(), 0.0])
+
+    def leave(self):
+        phase, start, child_time = self.stack[-1]
+        elapsed = self.clock() - start
+        stack = tuple(frame[0] for frame in self.stack)
+        self.stack.pop()
+        self.self_time[stack] += elapsed - child_time
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        if self.trial is not None:
+            totals = self.trial['phases'][phase]
+            totals['calls'] += 1
+            if phase not in stack[:-1]:  # count recursive calls once
+                totals['time'] += elapsed
+
+    def start_trial(self):
+        self.end_trial()
+        self.trial = {'trial': len(self.trials), 'phases': defaultdict(lambda: {'time': 0.0, 'calls': 0})}
+
+    def end_trial(self):
+        if self.trial is None:
+            return
+        agent = self.env.primary_agent
+        self.trial['steps'] = self.trial['phases']['step']['calls']
+        self.trial['q_states'] = len(agent.Q) if hasattr(agent, 'Q') else None
+        self.trial['phases'] = dict(self.trial['phases'])
+        self.trials.append(self.trial)
+        self.trial = None
+
+    def report(self):
+        """Print total time and calls per phase over all finished trials."""
+        totals = defaultdict(lambda: {'time': 0.0, 'calls': 0})
+        for trial in self.trials:
+            for phase, phase_totals in trial['phases'].iteritems():
+                totals[phase]['time'] += phase_totals['time']
+                totals[phase]['calls'] += phase_totals['calls']
+        print "{:10} {:>10} {:>10} {:>10}".format('phase', 'time (s)', 'calls', 'us/call')
+        for phase, phase_totals in sorted(totals.iteritems(), key=lambda item: -item[1]['time']):
+            print "{:10} {:10.3f} {:10d} {:10.2f}".format(phase, phase_totals['time'], phase_totals['calls'],
+                1e6 * phase_totals['time'] / max(phase_totals['calls'], 1))
+        if self.trials:
+            print "Q table: {} states after {} trials".format(self.trials[-1]['q_states'], len(self.trials))
+
+    def save_trials(self, filename):
+        """Write one CSV row per finished trial: steps, Q table size, and time and calls per phase."""
+        phases = sorted(set(phase for trial in self.trials for phase in trial['phases']))
+        with open(filename, 'w') as f:
+            f.write(','.join(['trial', 'steps', 'q_states'] +
+                             ["{}_{}".format(phase, column) for phase in phases for column in ('time', 'calls')]) + "\n")
+            for trial in self.trials:
+                row = [trial['trial'], trial['steps'], '' if trial['q_states'] is None else trial['q_states']]
+                for phase in phases:
+                    totals = trial['phases'].get(phase, {'time': 0.0, 'calls': 0})
+                    row += ["{:.6f}".format(totals['time']), totals['calls']]
+                f.write(','.join(str(value) for value in row) + "\n")
+
+    def save_folded(self, filename):
+        """Write exclusive times in microseconds as folded stacks, for flamegraph.pl."""
+        with open(filename, 'w') as f:
+            for stack, seconds in sorted(self.self_time.iteritems()):
+                f.write("{} {}\n".format(';'.join(stack), int(round(seconds * 1e6))))
@@ -0,0 +1,77 @@
+import random
+import itertools
+
+import numpy as np
+
+from environment import Environment
+
+
+class QTable(object):
+    """Q values of a LearningAgent, stored as one dense float32 array.
+
+    States are (waypoint, light, oncoming, left) tuples, as built by
+    LearningAgent.build_state_tuple(). The state space is small and fixed, so
+    every state is mapped to a row index up front and every action to a
+    column index; a lookup is a dict hit followed by array indexing.
+    """
+
+    actions = Environment.valid_actions
+    lights = ['green', 'red']
+
+    def __init__(self, initial_value=1., rng=random):
+        self.initial_value = initial_value
+        self.random = rng  # breaks ties between optimal actions
+        self.states = list(itertools.product(self.actions, self.lights, self.actions, self.actions))
+        self.state_index = dict((state, i) for i, state in enumerate(self.states))
+        self.action_index = dict((action, i) for i, action in enumerate(self.actions))
+        self.values = np.full((len(self.states), len(self.actions)), initial_value, dtype=np.float32)
+        self.visited = np.zeros(len(self.states), dtype=bool)  # states the agent has observed
+
+    def __len__(self):
+        """Number of states observed so far."""
+        return int(np.count_nonzero(self.visited))
+
+    def __contains__(self, state):
+        return self.visited[self.state_index[state]]
+
+    def visit(self, state):
+        """Mark a state as observed; returns its row index."""
+        i = self.state_index[state]
+        self.visited[i] = True
+        return i
+
+    def get(self, state, action):
+        return self.values[self.state_index[state], self.action_index[action]]
+
+    def max_value(self, state):
+        return self.values[self.state_index[state]].max()
+
+    def optimal_action(self, state):
+        """Action with the highest Q value; ties are broken at random."""
+        row = self.values[self.state_index[state]]
+        optimal_actions = np.flatnonzero(row == row.max())
+        if len(optimal_actions) > 1:
+            return self.actions[self.random.choice(optimal_actions)]
+        else:
+            return self.actions[optimal_actions[0]]
+
+    def items(self):
+        """(state, Q values per action) for every observed state."""
+        for i in np.flatnonzero(self.visited):
+            yield self.states[i], self.values[i]
+
+    def save(self, filename):
+        """Save the table as a .npy array; rows of unobserved states are NaN."""
+        values = self.values.copy()
+        values[~self.visited] = np.nan
+        np.save(filename, values)
+
+    @classmethod
+    def load(cls, filename, initial_value=1., rng=random):
+        q = cls(initial_value, rng)
+        values = np.load(filename)
+        if values.shape != q.values.shape:
+            raise ValueError("Q table in {} has shape {}, expected {}".format(filename, values.shape, q.values.shape))
+        q.visited = ~np.isnan(values).any(axis=1)
+        q.values[q.visited] = values[q.visited]
+        return q
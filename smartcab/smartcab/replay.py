@@ -0,0 +1,36 @@
+import numpy as np
+
+
+class ReplayBuffer(object):
+    """Fixed-size ring buffer of (state, action, reward, next_state) transitions.
+
+    States and actions are stored as QTable row and column indices in
+    preallocated arrays; once the buffer is full, the oldest transitions are
+    overwritten.
+    """
+
+    def __init__(self, capacity, rng=np.random):
+        self.capacity = capacity
+        self.random = rng  # draws the minibatches
+        self.states = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros(capacity, dtype=np.int32)
+        self.size = 0  # number of valid transitions
+        self.added = 0  # number of transitions ever added
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state):
+        i = self.added % self.capacity
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.added += 1
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """Indices of a minibatch drawn uniformly, with replacement."""
+        return self.random.randint(0, self.size, size=batch_size)
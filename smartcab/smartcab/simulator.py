@@ -3,6 +3,8 @@ import time
 import random
 import importlib
 
+import numpy as np
+
 class Simulator(object):
     """Simulates agents in a dynamic smartcab environment.
 
@@ -21,7 +23,7 @@ class Simulator(object):
         'orange'  : (255, 128,   0)
     }
 
-    def __init__(self, env, size=None, update_delay=1.0, display=True):
+    def __init__(self, env, size=None, update_delay=1.0, display=True, frame_dir=None):
         self.env = env
         self.size = size if size is not None else ((self.env.grid_size[0] + 1) * self.env.block_size, (self.env.grid_size[1] + 1) * self.env.block_size)
         self.width, self.height = self.size
@@ -36,21 +38,36 @@ class Simulator(object):
         self.last_updated = 0.0
         self.update_delay = update_delay
 
+        self.results = []  # per-trial outcomes, filled in by run_headless()
+        self.steps_per_second = None
+
+        # Offscreen mode: render every step into an image file in frame_dir, e.g. to make a video
+        self.frame_dir = frame_dir
+        if self.frame_dir is not None:
+            display = True
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no window needed
+            if not os.path.isdir(self.frame_dir):
+                os.makedirs(self.frame_dir)
+
         self.display = display
         if self.display:
             try:
                 self.pygame = importlib.import_module('pygame')
                 self.pygame.init()
-                self.screen = self.pygame.display.set_mode(self.size)
+                self.screen = self.pygame.display.set_mode(self.size, 0, 32 if self.frame_dir is not None else 0)  # the dummy driver defaults to 8 bits
 
                 self.frame_delay = max(1, int(self.update_delay * 1000))  # delay between GUI frames in ms (min: 1)
                 self.agent_sprite_size = (32, 32)
                 self.agent_circle_radius = 10  # radius of circle, when using simple representation
+                self.sprites = {}  # (color, heading) -> sprite rotated to face heading, or None to draw a circle
                 for agent in self.env.agent_states:
-                    agent._sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
-                    agent._sprite_size = (agent._sprite.get_width(), agent._sprite.get_height())
+                    self.sprites[(agent.color, (1, 0))] = self.load_sprite(agent.color)
 
                 self.font = self.pygame.font.Font(None, 28)
+                self.text_surfaces = {}  # (text, color) -> rendered text
+                self.background = None  # roads, intersections and lights, drawn once and then patched
+                self.light_states = None  # light states drawn on the background
+                self.dirty_rects = []  # screen areas drawn over in the last frame
                 self.paused = False
             except ImportError as e:
                 self.display = False
@@ -60,6 +77,13 @@ class Simulator(object):
                 print "Simulator.__init__(): Error initializing GUI objects; display disabled.\n{}: {}".format(e.__class__.__name__, e)
 
     def run(self, n_trials=1):
+        if self.frame_dir is not None and self.display:
+            self.run_offscreen(n_trials)
+            return
+        if not self.display and self.update_delay <= 0:
+            self.run_headless(n_trials)
+            return
+
         self.quit = False
         for trial in xrange(n_trials):
             print "Simulator.run(): Trial {}".format(trial)  # [debug]
@@ -105,56 +129,188 @@ class Simulator(object):
             if self.quit:
                 break
 
-    def render(self):
-        # Clear screen
-        self.screen.fill(self.bg_color)
+    def run_headless(self, n_trials=1):
+        """Run trials back to back as fast as possible, without GUI or timers.
+
+        Steps the environment in a tight loop until each trial is done. Instead
+        of printing as it goes, appends one dict per trial to self.results and
+        reports the overall speed at the end (unless env.verbose is off).
+        """
+        self.quit = False
+        verbose = self.env.verbose
+        self.env.verbose = False
+        total_steps = 0
+        start_time = time.time()
+        try:
+            for trial in xrange(n_trials):
+                self.env.reset()
+                while not self.env.done:
+                    self.env.step()
+                total_steps += self.env.t
+                self.results.append(self.trial_result(trial))
+        except KeyboardInterrupt:
+            self.quit = True
+        finally:
+            self.env.verbose = verbose
+
+        elapsed = time.time() - start_time
+        self.steps_per_second = total_steps / elapsed if elapsed > 0 else float('inf')
+        if verbose:
+            print "Simulator.run_headless(): {} trials, {} successful, {:.0f} steps/s".format(
+            len(self.results), sum(result['success'] for result in self.results), self.steps_per_second)  # [debug]
+        return self.results
+
+    def trial_result(self, trial):
+        """Outcome of the trial that just ended, as stored in self.results."""
+        result = dict(self.env.trial_data)
+        result['trial'] = trial
+        result['steps'] = self.env.t
+        result['deadline'] = self.env.get_deadline(self.env.primary_agent)
+        return result
+
+    def run_offscreen(self, n_trials=1):
+        """Render one frame per step into frame_dir, as fast as possible.
+
+        Frames are written as frame_dir/trial<trial>_<t>.png, starting with
+        the frame before the first step of each trial.
+        """
+        self.quit = False
+        verbose = self.env.verbose
+        self.env.verbose = False
+        try:
+            for trial in xrange(n_trials):
+                self.env.reset()
+                self.render()
+                self.save_frame(trial)
+                while not self.env.done:
+                    self.env.step()
+                    self.render()
+                    self.save_frame(trial)
+                self.results.append(self.trial_result(trial))
+        except KeyboardInterrupt:
+            self.quit = True
+        finally:
+            self.env.verbose = verbose
+        return self.results
+
+    def save_frame(self, trial):
+        self.pygame.image.save(self.screen, os.path.join(self.frame_dir, "trial{:04d}_{:05d}.png".format(trial, self.env.t)))
 
+    def load_sprite(self, color):
+        return self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(color))), self.agent_sprite_size)
+
+    def get_sprite(self, color, heading):
+        """Car sprite for a color, rotated to face heading; None if there is no image for the color."""
+        key = (color, heading)
+        if key not in self.sprites:
+            sprite = self.sprites.get((color, (1, 0)), False)
+            if sprite is False:
+                try:
+                    sprite = self.load_sprite(color)
+                except self.pygame.error:
+                    sprite = None
+                self.sprites[(color, (1, 0))] = sprite
+            if sprite is not None and heading != (1, 0):
+                sprite = self.pygame.transform.rotate(sprite, 180 if heading[0] == -1 else heading[1] * -90)
+            self.sprites[key] = sprite
+        return self.sprites[key]
+
+    def get_text(self, text, color):
+        key = (text, color)
+        if key not in self.text_surfaces:
+            if len(self.text_surfaces) >= 4096:  # status lines keep changing; don't let the cache grow without bound
+                self.text_surfaces.clear()
+            self.text_surfaces[key] = self.font.render(text, True, color, self.bg_color)
+        return self.text_surfaces[key]
+
+    def light_rect(self, intersection):
+        """Screen area covered by the light (and the roads) at an intersection."""
+        half_size = 15 + self.road_width
+        return self.pygame.Rect(intersection[0] * self.env.block_size - half_size, intersection[1] * self.env.block_size - half_size,
+                                2 * half_size + 1, 2 * half_size + 1)
+
+    def draw_light(self, surface, intersection, state):
+        if state:  # North-South is open
+            self.pygame.draw.line(surface, self.colors['green'],
+                (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
+                (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
+        else:  # East-West is open
+            self.pygame.draw.line(surface, self.colors['green'],
+                (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
+                (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
+
+    def render_background(self):
+        """Draw the static elements (roads, intersections) once, and the lights on top."""
+        self.roads_surface = self.screen.copy()  # same pixel format (and palette) as the screen
+        self.roads_surface.fill(self.bg_color)
+        for road in self.env.iter_roads():
+            self.pygame.draw.line(self.roads_surface, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+        for intersection in self.env.intersections:
+            self.pygame.draw.circle(self.roads_surface, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
+
+        self.background = self.roads_surface.copy()
+        self.light_states = self.env.intersections.states()
+        for intersection in self.env.intersections:
+            self.draw_light(self.background, intersection, self.env.intersections.get_state(intersection))
+
+    def update_lights(self):
+        """Redraw the lights that switched since the last frame; returns the areas changed."""
+        states = self.env.intersections.states()
+        rects = []
+        for index in np.argwhere(states != self.light_states):
+            intersection = (index[0] + self.env.bounds[0], index[1] + self.env.bounds[1])
+            rect = self.light_rect(intersection)
+            self.background.blit(self.roads_surface, rect, rect)
+            self.draw_light(self.background, intersection, states[tuple(index)])
+            rects.append(rect)
+        self.light_states = states
+        return rects
+
+    def render(self):
         # Draw elements
-        # * Static elements
-        for road in self.env.roads:
-            self.pygame.draw.line(self.screen, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
-
-        for intersection, traffic_light in self.env.intersections.iteritems():
-            self.pygame.draw.circle(self.screen, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
-            if traffic_light.state:  # North-South is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
-            else:  # East-West is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
-                    (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
-
-        # * Dynamic elements
+        # * Static elements, only where they changed or were drawn over in the last frame
+        if self.background is None:
+            self.render_background()
+            self.screen.blit(self.background, (0, 0))
+            restored = [self.screen.get_rect()]
+        else:
+            restored = self.update_lights() + self.dirty_rects
+            for rect in restored:
+                self.screen.blit(self.background, rect, rect)
+
+        # * Dynamic elements (the rects pygame.draw returns can fall a pixel
+        #   short of what it paints, so they are grown before being kept)
+        drawn = []
         for agent, state in self.env.agent_states.iteritems():
             # Compute precise agent location here (back from the intersection some)
             agent_offset = (2 * state['heading'][0] * self.agent_circle_radius, 2 * state['heading'][1] * self.agent_circle_radius)
             agent_pos = (state['location'][0] * self.env.block_size - agent_offset[0], state['location'][1] * self.env.block_size - agent_offset[1])
             agent_color = self.colors[agent.color]
-            if hasattr(agent, '_sprite') and agent._sprite is not None:
+            sprite = self.get_sprite(agent.color, state['heading'])
+            if sprite is not None:
                 # Draw agent sprite (image), properly rotated
-                rotated_sprite = agent._sprite if state['heading'] == (1, 0) else self.pygame.transform.rotate(agent._sprite, 180 if state['heading'][0] == -1 else state['heading'][1] * -90)
-                self.screen.blit(rotated_sprite,
-                    self.pygame.rect.Rect(agent_pos[0] - agent._sprite_size[0] / 2, agent_pos[1] - agent._sprite_size[1] / 2,
-                        agent._sprite_size[0], agent._sprite_size[1]))
+                drawn.append(self.screen.blit(sprite,
+                    self.pygame.rect.Rect(agent_pos[0] - self.agent_sprite_size[0] / 2, agent_pos[1] - self.agent_sprite_size[1] / 2,
+                        self.agent_sprite_size[0], self.agent_sprite_size[1])))
             else:
                 # Draw simple agent (circle with a short line segment poking out to indicate heading)
-                self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
-                self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width)
+                drawn.append(self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius).inflate(2, 2))
+                drawn.append(self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width).inflate(self.road_width, self.road_width))
             if agent.get_next_waypoint() is not None:
-                self.screen.blit(self.font.render(agent.get_next_waypoint(), True, agent_color, self.bg_color), (agent_pos[0] + 10, agent_pos[1] + 10))
+                drawn.append(self.screen.blit(self.get_text(agent.get_next_waypoint(), agent_color), (agent_pos[0] + 10, agent_pos[1] + 10)))
             if state['destination'] is not None:
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6)
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2)
+                drawn.append(self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6).inflate(2, 2))
+                drawn.append(self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2).inflate(2, 2))
 
         # * Overlays
         text_y = 10
         for text in self.env.status_text.split('\n'):
-            self.screen.blit(self.font.render(text, True, self.colors['red'], self.bg_color), (100, text_y))
+            drawn.append(self.screen.blit(self.get_text(text, self.colors['red']), (100, text_y)))
             text_y += 20
 
-        # Flip buffers
-        self.pygame.display.flip()
+        # Push the changed areas to the display
+        self.pygame.display.update(restored + drawn)
+        self.dirty_rects = drawn
 
     def pause(self):
         abs_pause_time = time.time()
@@ -167,5 +323,5 @@ class Simulator(object):
                 if event.type == self.pygame.KEYDOWN:
                     self.paused = False
             self.pygame.time.wait(self.frame_delay)
-        self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (100, self.height - 40))
+        self.dirty_rects.append(self.pygame.Rect((100, self.height - 40), self.font.size(pause_text)))  # erased by the next frame
         self.start_time += (time.time() - abs_pause_time)
@@ -0,0 +1,89 @@
+import time
+import argparse
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from environment import Environment
+from simulator import Simulator
+from agent import LearningAgent
+
+# Per-trial columns written to the results file, in order
+columns = ['config', 'seed', 'LR', 'DF', 'randomness', 'trial', 'success', 'penalties', 'steps', 'deadline', 'net_reward']
+
+
+def make_configs(seeds, LRs, DFs, randomness):
+    """Every combination of seed and hyperparameters, as a list of dicts."""
+    configs = []
+    for seed, LR, DF, epsilon in itertools.product(seeds, LRs, DFs, randomness):
+        configs.append({'config': len(configs), 'seed': seed, 'LR': LR, 'DF': DF, 'randomness': epsilon})
+    return configs
+
+
+def run_config(config, n_trials=100):
+    """Train one LearningAgent with the given config; returns its per-trial rows.
+
+    The environment's generator drives the lights, the dummy agents, action
+    selection and replay sampling, so seeding it here makes the result of a
+    config independent of which worker runs it and in which order.
+    """
+    e = Environment(seed=config['seed'])
+    e.verbose = False
+    a = e.create_agent(LearningAgent, LR=config['LR'], DF=config['DF'], randomness=config['randomness'])
+    e.set_primary_agent(a, enforce_deadline=True)
+    sim = Simulator(e, update_delay=0., display=False)
+    sim.run_headless(n_trials=n_trials)
+
+    rows = []
+    for result in sim.results:
+        row = dict(config)
+        row.update(result)
+        rows.append(row)
+    return rows
+
+
+def _run_config_star(args):
+    return run_config(*args)
+
+
+def run_sweep(configs, n_trials=100, processes=None):
+    """Run all configs on a process pool; returns the results as columns."""
+    pool = multiprocessing.Pool(processes)
+    try:
+        chunks = pool.imap_unordered(_run_config_star, [(config, n_trials) for config in configs])
+        rows = [row for chunk in chunks for row in chunk]
+    finally:
+        pool.terminate()
+        pool.join()
+
+    rows.sort(key=lambda row: (row['config'], row['trial']))
+    return dict((column, np.array([row[column] for row in rows])) for column in columns)
+
+
+def save_results(filename, results):
+    """Write the result columns to a .npz file, one array per column."""
+    np.savez_compressed(filename, **results)
+
+
+def run():
+    """Sweep LearningAgent hyperparameters over many seeds."""
+    parser = argparse.ArgumentParser(description=run.__doc__)
+    parser.add_argument('--seeds', type=int, default=10, help="number of seeds per hyperparameter combination")
+    parser.add_argument('--lr', type=float, nargs='+', default=[0.9], help="learning rates")
+    parser.add_argument('--df', type=float, nargs='+', default=[0.4], help="discount factors")
+    parser.add_argument('--randomness', type=float, nargs='+', default=[0.05], help="exploration rates")
+    parser.add_argument('--trials', type=int, default=100, help="trials per run")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--output', default='sweep.npz', help="results file")
+    args = parser.parse_args()
+
+    configs = make_configs(range(args.seeds), args.lr, args.df, args.randomness)
+    start_time = time.time()
+    results = run_sweep(configs, n_trials=args.trials, processes=args.processes)
+    save_results(args.output, results)
+    print "sweep.run(): {} configs x {} trials in {:.1f}s, success rate {:.3f}; results saved to {}".format(
+        len(configs), args.trials, time.time() - start_time, results['success'].mean(), args.output)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,295 @@
+import struct
+
+import numpy as np
+
+from environment import Agent, Environment
+
+# A trace is a stream of records, each starting with a one-byte tag:
+#   'T' trial header: trial number, seed, start, destination, deadline, grid
+#       size, agent colors, the primary agent's slot, the traffic lights
+#       (state at t = 0 and period) and every agent at the start
+#   'S' step: t, the primary agent's action, reward and deadline, then every
+#       agent after the step
+#   'E' end of trial: success, net reward, number of steps
+# All integers are little-endian. Agents are stored in agent_states order as
+# (x, y, heading, waypoint), with heading and waypoint as indices into
+# Environment.valid_headings and Environment.valid_actions.
+MAGIC = 'SCTRACE1'
+TRIAL, STEP, END = 'T', 'S', 'E'
+trial_format = struct.Struct('<IIHHHHiHHHH')  # trial, seed, start x/y, destination x/y, deadline, cols, rows, agents, primary
+step_format = struct.Struct('<iBfi')  # t, action, reward, deadline
+end_format = struct.Struct('<?fi')  # success, net reward, steps
+agent_dtype = np.dtype([('x', '<u2'), ('y', '<u2'), ('heading', 'u1'), ('waypoint', 'u1')])
+_missing = object()  # no instance attribute to restore
+
+
+class TraceRecorder(object):
+    """Append every trial an environment runs to a binary trace file.
+
+    attach() wraps env.reset, env.step and env.act on the instance, like
+    Profiler does; records are written as the simulation goes, so the file
+    is complete up to the last trial even if the run is interrupted.
+    Recording into an existing trace appends to it, numbering trials on
+    from the last one already in the file. close() puts back what was there
+    before, or, if something else has wrapped the methods again since,
+    leaves the wrappers passing calls through.
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, 'ab')
+        if self.f.tell() == 0:
+            self.f.write(MAGIC)
+            self.trial = 0
+        else:
+            reader = TraceReader(filename)
+            self.trial = reader.trial(len(reader) - 1).trial + 1 if len(reader) else 0
+        self.env = None
+        self.wrapped = []  # (method name, previous instance attribute, wrapper)
+        self.recording = False
+        self.in_trial = False
+        self.action = None
+        self.reward = 0.0
+
+    def attach(self, env):
+        """Record env from its next reset on; returns self."""
+        self.env = env
+        self.recording = True
+        reset, step, act = env.reset, env.step, env.act
+
+        def recorded_reset(*args, **kwargs):
+            if not self.recording:
+                return reset(*args, **kwargs)
+            self.end_trial()
+            result = reset(*args, **kwargs)
+            self.start_trial()
+            return result
+
+        def recorded_step(*args, **kwargs):
+            if not self.recording:
+                return step(*args, **kwargs)
+            self.action, self.reward = None, 0.0
+            result = step(*args, **kwargs)
+            self.write_step()
+            return result
+
+        def recorded_act(agent, action):
+            reward = act(agent, action)
+            if self.recording and agent is self.env.primary_agent:
+                self.action, self.reward = action, reward
+            return reward
+
+        for name, method in (('reset', recorded_reset), ('step', recorded_step), ('act', recorded_act)):
+            previous = env.__dict__.get(name, _missing)
+            setattr(env, name, method)
+            self.wrapped.append((name, previous, method))
+        return self
+
+    def close(self):
+        """End the trial in progress, stop recording and close the file."""
+        self.end_trial()
+        self.recording = False
+        for name, previous, wrapper in reversed(self.wrapped):
+            if self.env.__dict__.get(name) is not wrapper:
+                continue  # wrapped again since: stays in the chain, passing calls through
+            if previous is _missing:
+                delattr(self.env, name)
+            else:
+                setattr(self.env, name, previous)
+        self.wrapped = []
+        self.f.close()
+
+    def agents(self):
+        agents = np.zeros(len(self.env.agent_states), dtype=agent_dtype)
+        for i, (agent, state) in enumerate(self.env.agent_states.iteritems()):
+            agents[i] = (state['location'][0], state['location'][1],
+                         Environment.valid_headings.index(state['heading']),
+                         Environment.valid_actions.index(agent.get_next_waypoint()))
+        return agents
+
+    def start_trial(self):
+        env = self.env
+        primary = env.agent_states[env.primary_agent]
+        agents = list(env.agent_states)
+        lights = env.intersections
+        self.f.write(TRIAL)
+        self.f.write(trial_format.pack(self.trial, env.trial_seed,
+            primary['location'][0], primary['location'][1], primary['destination'][0], primary['destination'][1],
+            primary['deadline'], env.grid_size[0], env.grid_size[1], len(agents), agents.index(env.primary_agent)))
+        for agent in agents:
+            self.f.write(struct.pack('<B', len(agent.color)) + agent.color)
+        self.f.write(np.packbits(lights.state.ravel()).tobytes())
+        self.f.write(lights.period.astype(np.uint8).tobytes())
+        self.f.write(self.agents().tobytes())
+        self.in_trial = True
+
+    def write_step(self):
+        env = self.env
+        self.f.write(STEP)
+        self.f.write(step_format.pack(env.t - 1, Environment.valid_actions.index(self.action), self.reward,
+                                      env.agent_states[env.primary_agent]['deadline']))
+        self.f.write(self.agents().tobytes())
+
+    def end_trial(self):
+        if not self.in_trial:
+            return
+        self.f.write(END)
+        self.f.write(end_format.pack(self.env.trial_data['success'], self.env.trial_data['net_reward'], self.env.t))
+        self.f.flush()
+        self.in_trial = False
+        self.trial += 1
+
+
+class TrialTrace(object):
+    """One recorded trial; any step can be looked up without simulating."""
+
+    def __init__(self, header, colors, light_state, light_period, frames, steps, outcome):
+        (self.trial, self.seed, start_x, start_y, destination_x, destination_y, self.deadline,
+         cols, rows, n_agents, self.primary) = header
+        self.start = (start_x, start_y)
+        self.destination = (destination_x, destination_y)
+        self.grid_size = (cols, rows)
+        self.colors = colors
+        self.light_state = light_state  # state of every light at t = 0, indexed by [x - 1, y - 1]
+        self.light_period = light_period
+        self.frames = frames  # agents at the start and after each step, shape (steps + 1, agents)
+        self.steps = steps  # (t, action, reward, deadline) per step
+        self.outcome = outcome  # (success, net reward, steps), or None if the trial was cut short
+
+    def __len__(self):
+        return len(self.steps)
+
+    def lights(self, t):
+        """State of every light at time t."""
+        return self.light_state ^ ((t // self.light_period) % 2 == 1)
+
+    def frame(self, step):
+        """Everything recorded after the given step (0 is the first step)."""
+        t, action, reward, deadline = self.steps[step]
+        agents = self.frames[step + 1]
+        return {
+            't': t,
+            'action': Environment.valid_actions[action],
+            'reward': reward,
+            'deadline': deadline,
+            'locations': zip(agents['x'].tolist(), agents['y'].tolist()),
+            'headings': [Environment.valid_headings[i] for i in agents['heading']],
+            'waypoints': [Environment.valid_actions[i] for i in agents['waypoint']],
+            'lights': self.lights(t)}
+
+
+class TraceReader(object):
+    """Random access to the trials of a trace file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offsets = []  # file offset of each trial header
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a smartcab trace".format(filename))
+            while True:
+                offset = f.tell()
+                tag = f.read(1)
+                if not tag:
+                    break
+                if tag == TRIAL:
+                    self.offsets.append(offset)
+                    self.read_trial_header(f)
+                elif tag == STEP:
+                    f.seek(step_format.size + self.n_agents * agent_dtype.itemsize, 1)
+                elif tag == END:
+                    f.seek(end_format.size, 1)
+                else:
+                    raise ValueError("Corrupt trace {}: unknown record {!r} at offset {}".format(filename, tag, offset))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read_trial_header(self, f):
+        header = trial_format.unpack(f.read(trial_format.size))
+        cols, rows, self.n_agents = header[7], header[8], header[9]
+        colors = []
+        for i in xrange(self.n_agents):
+            length = struct.unpack('<B', f.read(1))[0]
+            colors.append(f.read(length))
+        n_lights = cols * rows
+        packed = np.frombuffer(f.read((n_lights + 7) // 8), dtype=np.uint8)
+        light_state = np.unpackbits(packed)[:n_lights].astype(bool).reshape(cols, rows)
+        light_period = np.frombuffer(f.read(n_lights), dtype=np.uint8).reshape(cols, rows)
+        agents = np.frombuffer(f.read(self.n_agents * agent_dtype.itemsize), dtype=agent_dtype)
+        return header, colors, light_state, light_period, agents
+
+    def trial(self, i):
+        """Load trial i (in recording order) as a TrialTrace."""
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offsets[i] + 1)
+            header, colors, light_state, light_period, agents = self.read_trial_header(f)
+            frames = [agents]
+            steps = []
+            outcome = None
+            while True:
+                tag = f.read(1)
+                if tag == STEP:
+                    steps.append(step_format.unpack(f.read(step_format.size)))
+                    frames.append(np.frombuffer(f.read(self.n_agents * agent_dtype.itemsize), dtype=agent_dtype))
+                elif tag == END:
+                    outcome = end_format.unpack(f.read(end_format.size))
+                    break
+                else:
+                    break  # next trial, or a trace cut short
+        return TrialTrace(header, colors, light_state, light_period, np.array(frames), steps, outcome)
+
+
+class ReplayAgent(Agent):
+    """An agent that only shows where a recorded agent was."""
+
+    def __init__(self, env, color):
+        super(ReplayAgent, self).__init__(env)
+        self.color = color
+
+
+class ReplayEnvironment(Environment):
+    """Plays back a TrialTrace through the Environment interface.
+
+    Hand it to a Simulator to watch a recorded trial again:
+    Simulator(ReplayEnvironment(TraceReader(filename).trial(i))).run()
+    """
+
+    def __init__(self, trace):
+        super(ReplayEnvironment, self).__init__(grid_size=trace.grid_size, num_dummies=0)
+        self.trace = trace
+        self.verbose = False
+        self.replay_agents = [self.create_agent(ReplayAgent, color) for color in trace.colors]
+        self.primary_agent = self.replay_agents[trace.primary]
+        self.step_index = 0
+
+    def reset(self):
+        self.done = len(self.trace) == 0
+        self.t = 0
+        self.step_index = 0
+        self.trial_seed = self.trace.seed
+        success, net_reward, steps = self.trace.outcome if self.trace.outcome is not None else (False, 0.0, len(self.trace))
+        self.trial_data = {'success': success, 'net_reward': net_reward, 'penalties': sum(1 for step in self.trace.steps if step[2] < 0)}
+        self.intersections.state = self.trace.light_state.copy()
+        self.intersections.period = self.trace.light_period.copy()
+        self.intersections.update(0)
+        self.show(self.trace.frames[0], self.trace.deadline)
+        self.status_text = "trial: {}, seed: {}".format(self.trace.trial, self.trace.seed)
+
+    def step(self):
+        t, action, reward, deadline = self.trace.steps[self.step_index]
+        self.intersections.update(t)
+        self.show(self.trace.frames[self.step_index + 1], deadline)
+        self.t = t + 1
+        self.step_index += 1
+        self.status_text = "action: {}\nreward: {}".format(Environment.valid_actions[action], reward)
+        self.done = self.step_index >= len(self.trace)
+
+    def show(self, agents, deadline):
+        """Put every agent where the trace has it."""
+        for agent, (x, y, heading, waypoint) in zip(self.replay_agents, agents.tolist()):
+            self.agent_states[agent] = {
+                'location': (x, y),
+                'heading': Environment.valid_headings[heading],
+                'destination': self.trace.destination if agent is self.primary_agent else None,
+                'deadline': deadline if agent is self.primary_agent else None}
+            agent.next_waypoint = Environment.valid_actions[waypoint]